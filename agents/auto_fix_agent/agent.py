@@ -1,6 +1,8 @@
 import os
 import json
 import asyncio
+import hashlib
+from collections import deque
 from abc import ABC, abstractmethod
 from ibm_watsonx_ai.foundation_models import ModelInference
 from ibm_watsonx_ai import Credentials
@@ -13,6 +15,12 @@ PROJECT = os.getenv("PROJECT_ID")
 if not all([API_KEY, URL, PROJECT]):
     raise ValueError("Missing one of WATSONX_APIKEY, WATSONX_URL, PROJECT_ID")
 
+# Fix attempts processed concurrently, requests buffered ahead of the
+# workers, and attempts allowed in flight for any single run
+WORKERS = int(os.getenv("AUTOFIX_WORKERS", "4"))
+QUEUE_SIZE = int(os.getenv("AUTOFIX_QUEUE_SIZE", "100"))
+MAX_PER_RUN = int(os.getenv("AUTOFIX_MAX_PER_RUN", "2"))
+
 # Initialize LLM client
 creds = Credentials(url=URL, api_key=API_KEY)
 MODEL = ModelInference(model_id="ibm/granite-13b-instruct-v2",
@@ -28,6 +36,12 @@ class AutoFixAgent(BaseAgent):
     """
     Listens on 'workflow.autofix.request' for failed tasks,
     prompts Granite to generate a patch, and replies with 'workflow.autofix.response'.
+
+    Requests are handled by a pool of WORKERS tasks fed from a bounded
+    queue, with the blocking LLM call run in a thread. A request identical to
+    one already queued or in progress (same runId, taskId and failure
+    output) is dropped, and at most MAX_PER_RUN attempts per run are in flight; the
+    rest wait until one of that run's attempts finishes.
     """
 
     SUBJECT_REQUEST  = "workflow.autofix.request"
@@ -35,16 +49,72 @@ class AutoFixAgent(BaseAgent):
 
     def __init__(self, nc):
         self.nc = nc
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # (runId, taskId, failure signature) of requests queued, waiting or in
+        # progress. The run is part of the key: every run needs its own reply,
+        # even when another run's identical task fails the same way.
+        self.pending = set()
+        # runId -> attempts in progress / requests waiting on the run's cap
+        self.run_active = {}
+        self.run_deferred = {}
+
+    @staticmethod
+    def request_key(msg: dict):
+        failure = json.dumps(msg.get("output", {}), sort_keys=True, default=str)
+        return msg.get("runId"), msg.get("taskId"), hashlib.sha256(failure.encode()).hexdigest()
 
     async def run(self):
+        workers = [asyncio.create_task(self.worker()) for _ in range(WORKERS)]
         sub = await self.nc.subscribe(self.SUBJECT_REQUEST)
-        async for m in sub.messages:
-            payload = json.loads(m.data.decode())
+        try:
+            async for m in sub.messages:
+                payload = json.loads(m.data.decode())
+                key = self.request_key(payload)
+                if key in self.pending:
+                    print(f"[AutoFixAgent] Dropping duplicate request for task {key[1]} of run {key[0]}")
+                    continue
+                self.pending.add(key)
+                # Blocks while the queue is full, applying backpressure to the subscription
+                await self.queue.put((key, payload))
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def worker(self):
+        while True:
+            key, payload = await self.queue.get()
+            run_id = payload.get("runId")
+            if self.run_active.get(run_id, 0) >= MAX_PER_RUN:
+                self.run_deferred.setdefault(run_id, deque()).append((key, payload))
+                continue
+
+            self.run_active[run_id] = self.run_active.get(run_id, 0) + 1
+            try:
+                while True:
+                    await self.attempt(key, payload)
+                    deferred = self.run_deferred.get(run_id)
+                    if not deferred:
+                        break
+                    # Hand this run's slot straight to its next waiting request
+                    key, payload = deferred.popleft()
+            finally:
+                self.run_active[run_id] -= 1
+                if not self.run_active[run_id]:
+                    del self.run_active[run_id]
+                if run_id in self.run_deferred and not self.run_deferred[run_id]:
+                    del self.run_deferred[run_id]
+
+    async def attempt(self, key, payload: dict):
+        try:
             response = await self.handle(payload)
             await self.nc.publish(
                 self.SUBJECT_RESPONSE,
                 json.dumps(response).encode()
             )
+        except Exception as e:
+            print(f"[AutoFixAgent] Error fixing task {key[1]} of run {key[0]}: {e}")
+        finally:
+            self.pending.discard(key)
 
     async def handle(self, msg: dict) -> dict:
         run_id  = msg.get("runId")
@@ -57,17 +127,23 @@ class AutoFixAgent(BaseAgent):
             "Return: {\"taskId\": ..., \"patch\": {...}}"
         )
 
-        result = MODEL.generate_text(prompt=prompt, params={
+        # The watsonx client is blocking; keep it off the event loop
+        result = await asyncio.to_thread(MODEL.generate_text, prompt=prompt, params={
             "decoding_method": "greedy",
             "max_new_tokens": 200
         })
 
         # Attempt to parse returned JSON
         try:
-            return json.loads(result)
+            patch = json.loads(result)
         except json.JSONDecodeError:
+            patch = None
+        if not isinstance(patch, dict):
             # Fallback minimal patch
-            return {"taskId": task_id, "patch": {}}
+            patch = {"taskId": task_id, "patch": {}}
+        # The orchestrator takes the run from the envelope and the task from the patch
+        patch["taskId"] = task_id
+        return {"runId": run_id, "patch": patch}
 
 if __name__ == "__main__":
     import asyncio
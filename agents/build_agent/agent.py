@@ -1,9 +1,14 @@
 import os
 import sys
-import subprocess
+import time
 import asyncio
 import json
+import posixpath
+import re
+import hashlib
 import logging
+from collections import deque
+from datetime import datetime, timezone
 from nats.aio.client import Client as NATS
 
 # Configure logging
@@ -17,38 +22,390 @@ global_logger.addHandler(handler)
 # Environment variables
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 SUBJECT = "task.docker-build.request"
+LOG_SUBJECT = "workflow.logs.stream"
+# Lines of log tail carried inline in the reply; the full log is only
+# published on workflow.logs.stream
+LOG_TAIL_LINES = int(os.getenv("BUILD_LOG_TAIL_LINES", "200"))
+# Log lines are streamed in chunks of at most this many lines / seconds
+LOG_CHUNK_LINES = int(os.getenv("BUILD_LOG_CHUNK_LINES", "50"))
+LOG_CHUNK_INTERVAL = float(os.getenv("BUILD_LOG_CHUNK_INTERVAL", "0.5"))
+# Content-digest build cache: digest of context + Dockerfile + build args ->
+# immutable ID of the image built from it (tags can move to other content)
+BUILD_CACHE_ENABLED = os.getenv("BUILD_CACHE", "on").lower() not in ("0", "off", "false")
+BUILD_CACHE_INDEX = os.getenv("BUILD_CACHE_INDEX", "/tmp/build-cache/index.json")
 
-async def run_build(task_payload: dict) -> dict:
+cache_index = None
+cache_lock = asyncio.Lock()
+
+def _compile_dockerignore_pattern(pattern: str):
+    """
+    Translate one .dockerignore pattern to a regex the way Docker does:
+    `*` and `?` never cross `/`, `**` spans any number of directories.
+    """
+    regex = "^"
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        i += 1
+        if in_class:
+            # Character classes pass through as in Go's filepath.Match
+            if ch == "\\" and i < len(pattern):
+                regex += re.escape(pattern[i])
+                i += 1
+            else:
+                regex += ch
+                in_class = ch != "]"
+        elif ch == "[":
+            regex += ch
+            in_class = True
+        elif ch == "*":
+            if i < len(pattern) and pattern[i] == "*":
+                i += 1
+                if i < len(pattern) and pattern[i] == "/":
+                    i += 1
+                regex += ".*" if i == len(pattern) else "(.*/)?"
+            else:
+                regex += "[^/]*"
+        elif ch == "?":
+            regex += "[^/]"
+        elif ch == "\\":
+            if i == len(pattern):
+                raise ValueError(f"trailing backslash in .dockerignore pattern {pattern!r}")
+            regex += re.escape(pattern[i])
+            i += 1
+        else:
+            regex += re.escape(ch)
+    return re.compile(regex + "$")
+
+def _dockerignore_patterns(context: str, dockerfile: str = None):
+    """
+    Parse <context>/.dockerignore into (regex, exclusion) pairs, in file
+    order. Like the Docker CLI, the Dockerfile and .dockerignore themselves
+    are always sent. Raises ValueError for patterns that cannot be compiled.
+    """
+    path = os.path.join(context, ".dockerignore")
+    if not os.path.exists(path):
+        return []
+    lines = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            line = line.strip()
+            exclusion = line.startswith("!")
+            if exclusion:
+                line = line[1:].strip()
+            if not line:
+                continue
+            line = posixpath.normpath(line.replace(os.sep, "/"))
+            if len(line) > 1 and line.startswith("/"):
+                line = line.lstrip("/")
+            lines.append(("!" if exclusion else "") + line)
+    if not lines:
+        return []
+    lines.append("!.dockerignore")
+    rel = os.path.relpath(dockerfile or os.path.join(context, "Dockerfile"), context)
+    rel = rel.replace(os.sep, "/")
+    if not rel.startswith("../"):
+        lines.append("!" + rel)
+    patterns = []
+    for line in lines:
+        exclusion = line.startswith("!")
+        try:
+            patterns.append((_compile_dockerignore_pattern(line.lstrip("!")), exclusion))
+        except re.error as e:
+            raise ValueError(f"unsupported .dockerignore pattern {line!r}: {e}")
+    return patterns
+
+def _ignored(rel_path: str, patterns) -> bool:
+    """
+    Docker's rule: a pattern matches a path or any of its parent
+    directories, and the last matching pattern decides (`!` re-includes).
+    """
+    parts = rel_path.split("/")
+    candidates = ["/".join(parts[:i]) for i in range(len(parts), 0, -1)]
+    ignored = False
+    for regex, exclusion in patterns:
+        # Only patterns that could flip the current state need evaluating
+        if exclusion != ignored:
+            continue
+        if any(regex.match(candidate) for candidate in candidates):
+            ignored = not exclusion
+    return ignored
+
+def build_digest(context: str, dockerfile: str, build_args: dict) -> str:
+    """
+    SHA-256 over the build args, the Dockerfile and every file in the build
+    context (path, executable bit and content, in sorted order), skipping
+    .git and whatever .dockerignore keeps out of the context Docker sends.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(build_args or {}, sort_keys=True).encode())
+    dockerfile = dockerfile or os.path.join(context, "Dockerfile")
+    with open(dockerfile, "rb") as f:
+        h.update(b"\0dockerfile\0" + hashlib.sha256(f.read()).digest())
+
+    try:
+        patterns = _dockerignore_patterns(context, dockerfile)
+    except ValueError as e:
+        # Hashing too much only costs cache hits; hashing too little would
+        # reuse an image built from different content
+        global_logger.warning(f"Hashing the whole build context: {e}")
+        patterns = []
+    # Without `!` patterns nothing below an ignored directory can be sent
+    prune = not any(exclusion for _, exclusion in patterns)
+    for root, dirs, files in os.walk(context):
+        rel_root = os.path.relpath(root, context).replace(os.sep, "/")
+        dirs[:] = sorted(
+            d for d in dirs
+            if d != ".git" and not (
+                prune and _ignored(d if rel_root == "." else f"{rel_root}/{d}", patterns)
+            )
+        )
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, context).replace(os.sep, "/")
+            if _ignored(rel, patterns) or not os.path.isfile(full):
+                continue
+            file_hash = hashlib.sha256()
+            with open(full, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    file_hash.update(block)
+            executable = b"x" if os.access(full, os.X_OK) else b"-"
+            h.update(b"\0" + rel.encode() + b"\0" + executable + file_hash.digest())
+    return h.hexdigest()
+
+def _load_index() -> dict:
+    global cache_index
+    if cache_index is None:
+        try:
+            with open(BUILD_CACHE_INDEX) as f:
+                cache_index = json.load(f)
+        except (OSError, ValueError):
+            cache_index = {}
+    return cache_index
+
+def _save_index():
+    os.makedirs(os.path.dirname(BUILD_CACHE_INDEX) or ".", exist_ok=True)
+    tmp_path = BUILD_CACHE_INDEX + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache_index, f)
+    os.replace(tmp_path, BUILD_CACHE_INDEX)
+
+async def run_docker(*args) -> int:
+    proc = await asyncio.create_subprocess_exec(
+        "docker", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await proc.wait()
+
+async def image_id(ref: str):
+    """
+    Return the immutable ID (sha256:...) of a local image, or None.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "docker", "image", "inspect", "--format", "{{.Id}}", ref,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return stdout.decode().strip() or None
+
+async def lookup_cached_image(digest: str):
+    """
+    Return the ID of the image previously built from this digest, if that
+    image still exists locally.
+    """
+    async with cache_lock:
+        entry = _load_index().get(digest)
+    if not entry:
+        return None
+    # Entries from before IDs were recorded only name a tag, which may have
+    # moved since; treat them as misses
+    cached_id = entry.get("imageId")
+    if not cached_id or await image_id(cached_id) != cached_id:
+        async with cache_lock:
+            _load_index().pop(digest, None)
+            _save_index()
+        return None
+    return cached_id
+
+async def record_cached_image(digest: str, image: str):
+    built_id = await image_id(image)
+    if not built_id:
+        return
+    async with cache_lock:
+        _load_index()[digest] = {
+            "imageId": built_id,
+            "image": image,
+            "builtAt": datetime.now(timezone.utc).isoformat(),
+        }
+        _save_index()
+
+class LogStreamer:
+    """
+    Batches build output lines and publishes them to workflow.logs.stream
+    as log entries the ObserverAgent understands.
+    """
+
+    def __init__(self, nc, run_id: str, task_id: str):
+        self.nc = nc
+        self.run_id = run_id
+        self.task_id = task_id
+        self.seq = 0
+        self.lines = []
+        self.last_flush = time.monotonic()
+        self.ticker = None
+
+    def start(self):
+        # Flush lines left waiting when the build goes quiet
+        self.ticker = asyncio.create_task(self._tick())
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(LOG_CHUNK_INTERVAL)
+            if self.lines:
+                await self.flush()
+
+    async def close(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+        await self.flush()
+
+    async def add(self, line: str):
+        self.lines.append(line)
+        if (len(self.lines) >= LOG_CHUNK_LINES
+                or time.monotonic() - self.last_flush >= LOG_CHUNK_INTERVAL):
+            await self.flush()
+
+    async def flush(self, level: str = "INFO"):
+        self.last_flush = time.monotonic()
+        if not self.lines or self.nc is None:
+            self.lines = []
+            return
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "level": level,
+            "message": "\n".join(self.lines),
+            "runId": self.run_id,
+            "taskId": self.task_id,
+            "source": "build_agent",
+            "seq": self.seq,
+        }
+        self.seq += 1
+        self.lines = []
+        await self.nc.publish(LOG_SUBJECT, json.dumps(entry).encode())
+
+    def stream_ref(self) -> dict:
+        """
+        Where the full log went: chunks 0..chunks-1 on LOG_SUBJECT for this task.
+        """
+        return {"subject": LOG_SUBJECT, "runId": self.run_id, "taskId": self.task_id, "chunks": self.seq}
+
+async def run_build(task_payload: dict, run_id: str = None, task_id: str = None, nc=None) -> dict:
     """
     Performs a Docker build based on the task payload.
     Expects payload fields:
       - context: str (build context directory)
       - image: str (target image tag)
-    Returns a result dict with status and logs.
+      - dockerfile: str (optional, defaults to <context>/Dockerfile)
+      - build_args: dict (optional)
+    If the content digest of context, Dockerfile and build args matches an
+    earlier successful build, the image ID it produced is retagged instead.
+    Output is streamed to workflow.logs.stream while the build runs; only a
+    bounded tail is kept in memory and returned.
+    Returns a result dict with status, log tail, log stream reference and
+    cache info.
     """
     context = task_payload.get("context", ".")
     image = task_payload.get("image")
-    cmd = ["docker", "build", "-t", image, context]
+    dockerfile = task_payload.get("dockerfile")
+    build_args = task_payload.get("build_args") or {}
+    cmd = ["docker", "build", "-t", image]
+    if dockerfile:
+        cmd += ["-f", dockerfile]
+    for key, value in sorted(build_args.items()):
+        cmd += ["--build-arg", f"{key}={value}"]
+    cmd.append(context)
+
+    digest = None
+    if BUILD_CACHE_ENABLED:
+        try:
+            digest = await asyncio.to_thread(build_digest, context, dockerfile, build_args)
+        except OSError as e:
+            global_logger.warning(f"Could not compute build digest, building without cache: {e}")
+    if digest:
+        cached_id = await lookup_cached_image(digest)
+        # Always retag: `image` may point at other content by now
+        if cached_id and await run_docker("tag", cached_id, image) == 0:
+            message = f"Build cache hit ({digest[:12]}): tagged {cached_id} as {image}"
+            global_logger.info(message)
+            streamer = LogStreamer(nc, run_id, task_id)
+            streamer.lines.append(message)
+            await streamer.flush()
+            return {
+                "status": "pass",
+                "logs": message,
+                "truncated": False,
+                "logStream": streamer.stream_ref(),
+                "cache": {"hit": True, "digest": digest, "imageId": cached_id},
+            }
+
     global_logger.info(f"Running build: {' '.join(cmd)}")
 
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
+    tail = deque(maxlen=LOG_TAIL_LINES)
+    streamer = LogStreamer(nc, run_id, task_id)
+    total_lines = 0
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        limit=1024 * 1024,
     )
+    streamer.start()
+    read_error = None
+    try:
+        async for raw in proc.stdout:
+            line = raw.decode(errors="replace").rstrip("\n")
+            global_logger.info(line)
+            tail.append(line)
+            total_lines += 1
+            await streamer.add(line)
+    except Exception as e:
+        # e.g. a single output line over the 1 MiB reader limit; stop the
+        # build rather than leave it running with nobody draining its pipe
+        read_error = f"Aborted build: could not read its output ({e})"
+        proc.kill()
+    finally:
+        await streamer.close()
 
-    logs = []
-    for line in proc.stdout:
-        global_logger.info(line.strip())
-        logs.append(line)
+    return_code = await proc.wait()
+    status = "pass" if return_code == 0 and read_error is None else "fail"
+    if status == "fail":
+        message = read_error or f"docker build exited with code {return_code}"
+        global_logger.error(message)
+        tail.append(message)
+        streamer.lines.append(message)
+        await streamer.flush(level="ERROR")
 
-    return_code = proc.wait()
-    status = "pass" if return_code == 0 else "fail"
+    if status == "pass" and digest:
+        await record_cached_image(digest, image)
 
-    return {"status": status, "logs": "".join(logs)}
+    return {
+        "status": status,
+        "logs": "\n".join(tail),
+        "truncated": total_lines > len(tail),
+        "logStream": streamer.stream_ref(),
+        "cache": {"hit": False, "digest": digest},
+    }
 
-async def message_handler(msg):
+async def message_handler(nc, msg):
+    run_id = task_id = None
     try:
         data = json.loads(msg.data.decode())
         run_id = data.get("runId")
@@ -56,18 +413,33 @@ async def message_handler(msg):
         payload = data.get("payload", {})
         global_logger.info(f"Received build request for task {task_id}")
 
-        result = await run_build(payload)
+        result = await run_build(payload, run_id=run_id, task_id=task_id, nc=nc)
         response = {
             "runId": run_id,
             "taskId": task_id,
             "status": result["status"],
-            "output": {"logs": result["logs"]}
+            "output": {
+                "logs": result["logs"],
+                "truncated": result["truncated"],
+                "logStream": result["logStream"],
+                "cache": result["cache"],
+            }
+        }
+    except Exception as e:
+        global_logger.error(f"Error handling build request: {e}")
+        # Still answer, so the orchestrator records a failure instead of timing out
+        response = {
+            "runId": run_id,
+            "taskId": task_id,
+            "status": "fail",
+            "output": {"logs": f"Build agent error: {e}"}
         }
 
+    try:
         await msg.respond(json.dumps(response).encode())
-        global_logger.info(f"Published build response for task {task_id} (status={result['status']})")
+        global_logger.info(f"Published build response for task {task_id} (status={response['status']})")
     except Exception as e:
-        global_logger.error(f"Error handling build request: {e}")
+        global_logger.error(f"Error publishing build response: {e}")
 
 async def main():
     nc = NATS()
@@ -79,7 +451,7 @@ async def main():
     global_logger.info(f"Subscribed to subject {SUBJECT}")
 
     async for msg in sub.messages:
-        asyncio.create_task(message_handler(msg))
+        asyncio.create_task(message_handler(nc, msg))
 
 if __name__ == "__main__":
     try:
@@ -4,7 +4,12 @@ import asyncio
 import json
 import logging
 from nats.aio.client import Client as NATS
-from opa import OpaClient
+from orchestrator.compliance import PolicyEngine
+
+try:
+    from opa import OpaClient
+except ImportError:  # optional: only needed with COMPLIANCE_ENGINE=opa
+    OpaClient = None
 
 # Configure logging
 global_logger = logging.getLogger("compliance_agent")
@@ -18,25 +23,39 @@ global_logger.addHandler(handler)
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 OPA_URL = os.getenv("OPA_URL", "http://opa:8181/v1/data")
 SUBJECT = "verify.opa.request"
+# "local" evaluates the compliance rules in-process; "opa" sends every
+# uncached input to the OPA server instead
+COMPLIANCE_ENGINE = os.getenv("COMPLIANCE_ENGINE", "local").lower()
+DECISION_CACHE_SIZE = int(os.getenv("COMPLIANCE_DECISION_CACHE_SIZE", "4096"))
 
-# Initialize OPA client
-opa_client = OpaClient(base_url=OPA_URL)
+policy_engine = PolicyEngine(max_entries=DECISION_CACHE_SIZE)
+opa_client = OpaClient(base_url=OPA_URL) if COMPLIANCE_ENGINE == "opa" else None
 
 async def run_compliance_check(task_payload: dict) -> dict:
     """
-    Sends payload to OPA for policy evaluation.
+    Evaluates the payload against the compliance policies, in-process by
+    default or through OPA when COMPLIANCE_ENGINE=opa. Identical inputs are
+    answered from the decision cache.
     Expects payload fields:
-      - input: dict (task output to validate)
-    Returns pass/fail and any policy violations.
+      - output: dict (policy input to validate)
+    Returns pass/fail, any policy violations and warnings.
     """
     input_data = task_payload.get("output", {})
-    global_logger.info("Running compliance check with OPA...")
 
-    result = opa_client.evaluate(input_data)
-    violations = result.get("result", [])
-    status = "pass" if not violations else "fail"
+    if opa_client is None:
+        decision = policy_engine.evaluate(input_data)
+    else:
+        decision = policy_engine.cached(input_data)
+        if decision is None:
+            global_logger.info("Running compliance check with OPA...")
+            # The OPA client is blocking; keep it off the event loop
+            result = await asyncio.to_thread(opa_client.evaluate, input_data)
+            decision = {"deny": result.get("result", []), "warn": []}
+            policy_engine.remember(input_data, decision)
 
-    return {"status": status, "violations": violations}
+    violations = decision["deny"]
+    status = "pass" if not violations else "fail"
+    return {"status": status, "violations": violations, "warnings": decision["warn"]}
 
 async def message_handler(msg):
     try:
@@ -51,7 +70,10 @@ async def message_handler(msg):
             "runId": run_id,
             "taskId": task_id,
             "status": result["status"],
-            "output": {"violations": result.get("violations", [])}
+            "output": {
+                "violations": result.get("violations", []),
+                "warnings": result.get("warnings", []),
+            }
         }
 
         await msg.respond(json.dumps(response).encode())
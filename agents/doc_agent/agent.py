@@ -1,14 +1,25 @@
 # agents/doc_agent/agent.py
 import os
 import json
+import time
 import asyncio
 from nats.aio.client import Client as NATS
+from orchestrator import metrics
 from orchestrator.llm_client import LLMClient
 
+# Generated text is published as progress events once this many characters
+# are pending or this many seconds have passed since the last event
+PROGRESS_CHUNK_CHARS = int(os.getenv("DOC_PROGRESS_CHUNK_CHARS", "256"))
+PROGRESS_CHUNK_INTERVAL = float(os.getenv("DOC_PROGRESS_CHUNK_INTERVAL", "0.25"))
+# Port for Prometheus metrics (LLM call latency); unset disables the endpoint
+METRICS_PORT = os.getenv("METRICS_PORT")
+
 class DocAgent:
     """
     Agent that generates documentation or release notes using Granite LLM.
     Listens on subject 'task.llm-doc.request'.
+    While generating, the text so far is streamed as progress events on
+    'workflow.events.<runId>.<taskId>.progress'.
     """
     subject = "task.llm-doc.request"
 
@@ -16,8 +27,70 @@ class DocAgent:
         self.nc = NATS()
         self.nats_url = nats_url
         self.llm = LLMClient()
+        # template path -> (mtime_ns, size, text)
+        self.templates = {}
+
+    def load_template(self, template_path: str) -> str:
+        """
+        Return a template's text, re-reading the file only when its
+        modification time or size has changed.
+        """
+        if not template_path or not os.path.exists(template_path):
+            raise FileNotFoundError(f"Template not found: {template_path}")
+        stat = os.stat(template_path)
+        cached = self.templates.get(template_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        with open(template_path) as f:
+            template = f.read()
+        self.templates[template_path] = (stat.st_mtime_ns, stat.st_size, template)
+        return template
+
+    async def publish_progress(self, run_id, task_id, seq: int, delta: str, length: int, done: bool = False):
+        event = {
+            "type": "doc.progress",
+            "runId": run_id,
+            "taskId": task_id,
+            "seq": seq,
+            "delta": delta,
+            "length": length,
+            "done": done
+        }
+        await self.nc.publish(f"workflow.events.{run_id}.{task_id}.progress", json.dumps(event).encode())
+
+    async def generate(self, run_id, task_id, prompt: str) -> str:
+        """
+        Stream the generation off the event loop, publishing the text as
+        coalesced progress events. The first chunk is published immediately.
+        Returns the full document.
+        """
+        parts = []
+        pending = []
+        pending_chars = 0
+        length = 0
+        seq = 0
+        last_publish = None
+        async for chunk in self.llm.astream_text(prompt):
+            parts.append(chunk)
+            pending.append(chunk)
+            pending_chars += len(chunk)
+            length += len(chunk)
+            now = time.monotonic()
+            if (last_publish is None
+                    or pending_chars >= PROGRESS_CHUNK_CHARS
+                    or now - last_publish >= PROGRESS_CHUNK_INTERVAL):
+                await self.publish_progress(run_id, task_id, seq, "".join(pending), length)
+                seq += 1
+                pending = []
+                pending_chars = 0
+                last_publish = now
+        await self.publish_progress(run_id, task_id, seq, "".join(pending), length, done=True)
+        return "".join(parts)
 
     async def start(self):
+        if METRICS_PORT:
+            metrics.start_http_server(int(METRICS_PORT))
+            print(f"[DocAgent] Serving metrics on :{METRICS_PORT}/metrics")
         # Connect to NATS and subscribe
         await self.nc.connect(servers=[self.nats_url])
         sub = await self.nc.subscribe(self.subject)
@@ -34,11 +107,8 @@ class DocAgent:
             template_path = payload.get("template")
             source = payload.get("data_source")
 
-            # Load template
-            if not os.path.exists(template_path):
-                raise FileNotFoundError(f"Template not found: {template_path}")
-            with open(template_path) as f:
-                template = f.read()
+            # Load template (cached until the file changes)
+            template = self.load_template(template_path)
 
             # Fetch data for template (e.g., GitHub PRs)
             # For demo, we stub it as an empty dict
@@ -47,8 +117,8 @@ class DocAgent:
             # Render prompt
             prompt = template.format(**context)
 
-            # Call LLM to generate docs
-            doc_text = self.llm.generate_text(prompt)
+            # Call LLM to generate docs, streaming progress as it goes
+            doc_text = await self.generate(run_id, task_id, prompt)
 
             # Publish response
             response = {
@@ -2,14 +2,66 @@
 
 import os
 import json
+import time
 import asyncio
+from collections import OrderedDict
+import aiohttp
 from nats.aio.client import Client as NATS
 from nats.aio.errors import ErrConnectionClosed, ErrTimeout, ErrNoServers
 
+# Notification pipeline: entries waiting for the aggregator (beyond this they
+# are dropped and counted), the window over which entries of one run/task are
+# folded into a single message, and the webhook rate limit (posts per second
+# with a burst allowance; a rate of 0 disables the limit)
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_WINDOW = float(os.getenv("NOTIFY_WINDOW", "5"))
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "1"))
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", "5"))
+# Distinct messages listed per notification; the rest are only counted
+NOTIFY_MAX_DISTINCT = int(os.getenv("NOTIFY_MAX_DISTINCT", "10"))
+# How often the notification counters are logged (seconds, 0 disables)
+NOTIFY_STATS_INTERVAL = float(os.getenv("NOTIFY_STATS_INTERVAL", "60"))
+
+NOTIFY_LEVELS = ("ERROR", "WARN", "WARNING")
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` acquisitions per second with bursts of up
+    to `burst` (at least 1). A rate of 0 or less never waits. Meant for a
+    single consumer task.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
 class ObserverAgent:
     """
     Listens on 'workflow.logs.stream' NATS subject,
     captures logs and metrics, and posts notifications (e.g., Slack).
+
+    ERROR/WARN entries go through a bounded queue to an aggregator that folds
+    the entries of each run/task seen within NOTIFY_WINDOW seconds into one
+    deduplicated message. Messages are posted over a single pooled HTTP
+    session, rate limited by a token bucket. When the queue is full, entries
+    are dropped and counted rather than buffered without limit. The
+    counters are logged every NOTIFY_STATS_INTERVAL seconds when they change.
     """
 
     SUBJECT = "workflow.logs.stream"
@@ -19,15 +71,31 @@ class ObserverAgent:
         self.slack_webhook = os.getenv("SLACK_WEBHOOK_URL")
         if not self.slack_webhook:
             raise ValueError("SLACK_WEBHOOK_URL is missing or empty.")
+        self.session = None
+        self.queue = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self.bucket = TokenBucket(NOTIFY_RATE, NOTIFY_BURST)
+        self.counters = {"queued": 0, "dropped": 0, "posted": 0, "failed": 0}
 
     async def run(self):
-        sub = await self.nc.subscribe(self.SUBJECT)
-        async for msg in sub.messages:
-            try:
-                entry = json.loads(msg.data.decode())
-                await self.handle(entry)
-            except Exception as e:
-                print(f"[ObserverAgent] Failed to process log entry: {e}")
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+        aggregator = asyncio.create_task(self.aggregate())
+        reporter = asyncio.create_task(self.report_counters()) if NOTIFY_STATS_INTERVAL > 0 else None
+        try:
+            sub = await self.nc.subscribe(self.SUBJECT)
+            async for msg in sub.messages:
+                try:
+                    entry = json.loads(msg.data.decode())
+                    await self.handle(entry)
+                except Exception as e:
+                    print(f"[ObserverAgent] Failed to process log entry: {e}")
+        finally:
+            aggregator.cancel()
+            if reporter is not None:
+                reporter.cancel()
+            await self.session.close()
 
     async def handle(self, entry: dict):
         # Print to console (could stream to Prometheus, etc.)
@@ -38,17 +106,107 @@ class ObserverAgent:
         print(log_line)
 
         # Notify Slack on errors or warnings
-        if lvl in ("ERROR", "WARN"):
-            await self.post_to_slack(entry)
+        if lvl in NOTIFY_LEVELS:
+            try:
+                self.queue.put_nowait(entry)
+                self.counters["queued"] += 1
+            except asyncio.QueueFull:
+                self.counters["dropped"] += 1
+
+    async def report_counters(self):
+        last = None
+        while True:
+            await asyncio.sleep(NOTIFY_STATS_INTERVAL)
+            if self.counters != last:
+                last = dict(self.counters)
+                print(f"[ObserverAgent] Notifications: {json.dumps(last)}")
+
+    async def aggregate(self):
+        """
+        Collect entries for NOTIFY_WINDOW seconds after the first one arrives,
+        then post one notification per run/task.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batches = OrderedDict()
+            self.add_to_batch(batches, await self.queue.get())
+            deadline = loop.time() + NOTIFY_WINDOW
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.add_to_batch(batches, entry)
+
+            dropped = self.counters["dropped"]
+            for key, batch in batches.items():
+                await self.bucket.acquire()
+                await self.post_to_slack(self.format_batch(key, batch))
+            if self.counters["dropped"] > dropped:
+                print(f"[ObserverAgent] Notification queue full, dropped {self.counters['dropped']} entries so far")
+
+    @staticmethod
+    def add_to_batch(batches: OrderedDict, entry: dict):
+        key = (entry.get("runId"), entry.get("taskId"))
+        batch = batches.get(key)
+        if batch is None:
+            batch = batches[key] = {
+                "level": "WARN",
+                "first": entry.get("timestamp"),
+                "last": entry.get("timestamp"),
+                "count": 0,
+                "messages": OrderedDict(),
+                "other": 0,
+            }
+        if entry.get("level") == "ERROR":
+            batch["level"] = "ERROR"
+        batch["last"] = entry.get("timestamp")
+        batch["count"] += 1
+        message = str(entry.get("message"))
+        if message in batch["messages"]:
+            batch["messages"][message] += 1
+        elif len(batch["messages"]) < NOTIFY_MAX_DISTINCT:
+            batch["messages"][message] = 1
+        else:
+            batch["other"] += 1
+
+    @staticmethod
+    def format_batch(key, batch: dict) -> str:
+        run_id, task_id = key
+        scope = " ".join(part for part in (
+            f"run `{run_id}`" if run_id else "",
+            f"task `{task_id}`" if task_id else "",
+        ) if part) or "workflow"
+        if batch["count"] == 1:
+            message = next(iter(batch["messages"]))
+            return f"*{batch['level']}* at {batch['first']} in {scope}: {message}"
+        lines = [
+            f"{message} (x{count})" if count > 1 else message
+            for message, count in batch["messages"].items()
+        ]
+        if batch["other"]:
+            lines.append(f"... and {batch['other']} more")
+        body = "\n".join(lines)
+        return (
+            f"*{batch['level']}* {batch['count']} entries in {scope} "
+            f"between {batch['first']} and {batch['last']}:\n```\n{body}\n```"
+        )
 
-    async def post_to_slack(self, entry: dict):
-        import aiohttp
-        text = f"*{entry.get('level')}* at {entry.get('timestamp')}: {entry.get('message')}"
+    async def post_to_slack(self, text: str):
         payload = {"text": text}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.slack_webhook, json=payload) as resp:
+        try:
+            async with self.session.post(self.slack_webhook, json=payload) as resp:
                 if resp.status != 200:
+                    self.counters["failed"] += 1
                     print(f"[ObserverAgent] Slack webhook failed: {resp.status}")
+                    return
+                self.counters["posted"] += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.counters["failed"] += 1
+            print(f"[ObserverAgent] Slack webhook failed: {e}")
 
 if __name__ == "__main__":
     async def main():
@@ -2,9 +2,13 @@ import os
 import sys
 import asyncio
 import json
+import hashlib
 import logging
+from collections import OrderedDict
 from nats.aio.client import Client as NATS
+from orchestrator import metrics
 from orchestrator.llm_client import LLMClient
+from orchestrator.scheduler import DagError, validate_dag
 
 # Configure logging
 global_logger = logging.getLogger("planner_agent")
@@ -18,11 +22,90 @@ global_logger.addHandler(handler)
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 PLAN_REQUEST_SUBJECT = "workflow.plan.request"
 PLAN_RESPONSE_SUBJECT = "workflow.plan.response"
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+# Port for Prometheus metrics (LLM call latency); unset disables the endpoint
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Shared LLM client, LRU of generated DAGs keyed by spec hash, and in-flight
+# generations so concurrent identical requests wait on a single LLM call.
+llm = LLMClient()
+plan_cache: "OrderedDict[str, dict]" = OrderedDict()
+inflight_plans = {}
+
+def spec_hash(workflow_id: str, prompt: str, spec: dict, overrides: dict) -> str:
+    blob = json.dumps([workflow_id, prompt, spec, overrides], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def static_dag(spec: dict):
+    """
+    Return the spec's own `tasks:` list as a DAG if it is complete and valid,
+    otherwise None so the planner falls back to the LLM.
+    """
+    tasks = (spec or {}).get("tasks")
+    if not tasks or not isinstance(tasks, list):
+        return None
+    try:
+        validate_dag(tasks)
+    except DagError as e:
+        global_logger.warning(f"Spec tasks are not a valid DAG, planning with LLM: {e}")
+        return None
+    if not all(task.get("type") for task in tasks):
+        return None
+    return {"tasks": tasks}
+
+async def generate_plan(workflow_id: str, prompt: str, overrides: dict) -> dict:
+    # Craft prompt for planning
+    plan_prompt = f"Generate a JSON DAG for workflow '{workflow_id}' based on: {prompt}"
+    if overrides:
+        plan_prompt += f"\nApply these overrides: {json.dumps(overrides, sort_keys=True)}"
+    plan_json = await llm.agenerate_text(plan_prompt)
+
+    # Parse LLM output into JSON and reject anything the scheduler would
+    dag = json.loads(plan_json)
+    validate_dag(dag.get("tasks", []))
+    return dag
+
+async def plan(workflow_id: str, prompt: str, spec: dict, overrides: dict) -> dict:
+    """
+    Produce the DAG for a run: the spec's own tasks when they already form a
+    valid DAG, else a cached or freshly generated LLM plan.
+    """
+    dag = static_dag(spec)
+    if dag is not None:
+        return dag
+
+    key = spec_hash(workflow_id, prompt, spec, overrides)
+    if key in plan_cache:
+        plan_cache.move_to_end(key)
+        global_logger.info(f"Plan cache hit for workflow {workflow_id}")
+        return plan_cache[key]
+    if key in inflight_plans:
+        global_logger.info(f"Joining in-flight plan for workflow {workflow_id}")
+        return await asyncio.shield(inflight_plans[key])
+
+    future = asyncio.get_running_loop().create_future()
+    inflight_plans[key] = future
+    try:
+        dag = await generate_plan(workflow_id, prompt, overrides)
+        plan_cache[key] = dag
+        while len(plan_cache) > PLAN_CACHE_SIZE:
+            plan_cache.popitem(last=False)
+        future.set_result(dag)
+        return dag
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so the exception is not reported again when nobody joined
+        future.exception()
+        raise
+    finally:
+        del inflight_plans[key]
 
 async def message_handler(msg):
     """
-    Handle planning requests: invoke LLM to convert natural-language or YAML into DAG JSON.
-    Expected payload: { text: str, workflowId: str, runId: str, replyTo: subject }
+    Handle planning requests: use the spec's own DAG when it has one, else
+    invoke LLM to convert natural-language or YAML into DAG JSON.
+    Expected payload: { text: str, workflowId: str, runId: str, spec: dict,
+                        overrides: dict, replyTo: subject }
     """
     try:
         data = json.loads(msg.data.decode())
@@ -32,13 +115,7 @@ async def message_handler(msg):
         reply_to = data.get("replyTo", PLAN_RESPONSE_SUBJECT)
         global_logger.info(f"Received plan request for workflow {workflow_id}, run {run_id}")
 
-        llm = LLMClient()
-        # Craft prompt for planning
-        plan_prompt = f"Generate a JSON DAG for workflow '{workflow_id}' based on: {prompt}"  
-        plan_json = llm.generate_text(plan_prompt)
-
-        # Parse LLM output into JSON
-        dag = json.loads(plan_json)
+        dag = await plan(workflow_id, prompt, data.get("spec") or {}, data.get("overrides") or {})
 
         response = {"workflowId": workflow_id, "runId": run_id, "dag": dag}
         await msg.respond(json.dumps(response).encode())
@@ -47,6 +124,9 @@ async def message_handler(msg):
         global_logger.error(f"Error in planner_agent: {e}")
 
 async def main():
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+        global_logger.info(f"Serving metrics on :{METRICS_PORT}/metrics")
     nc = NATS()
     await nc.connect(servers=[NATS_URL])
     global_logger.info(f"Connected to NATS at {NATS_URL}")
@@ -1,10 +1,18 @@
 import os
 import sys
+import time
+import uuid
+import heapq
 import asyncio
 import json
 import logging
+from collections import OrderedDict, deque
 from nats.aio.client import Client as NATS
-from subprocess import PIPE, STDOUT, Popen
+
+try:
+    import ijson
+except ImportError:  # optional: reports are parsed with json.load without it
+    ijson = None
 
 # Configure logging
 global_logger = logging.getLogger("security_agent")
@@ -18,15 +26,166 @@ global_logger.addHandler(handler)
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 SUBJECT = "task.snyk.request"
 
-async def run_security_scan(task_payload: dict) -> dict:
+# Scan results are reused for the same (tool, image digest, vulnerability DB) within this TTL
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", "3600"))
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "256"))
+# How long a looked-up vulnerability DB version is trusted before asking the tool again
+DB_VERSION_TTL = float(os.getenv("SCAN_DB_VERSION_TTL", "300"))
+
+# Full JSON reports are kept here for audit and referenced from the reply;
+# mount a shared volume so other services can read them
+REPORT_DIR = os.getenv("SCAN_REPORT_DIR", "/reports")
+# Findings carried inline in the reply, most severe first
+REPORT_TOP_N = int(os.getenv("SCAN_REPORT_TOP_N", "20"))
+# Cap on the fixable-package list in the reply
+REPORT_MAX_FIXABLE = int(os.getenv("SCAN_REPORT_MAX_FIXABLE", "100"))
+# Lines of scanner stderr carried inline in the reply
+STDERR_TAIL_LINES = int(os.getenv("SCAN_STDERR_TAIL_LINES", "100"))
+
+SEVERITY_RANK = {"CRITICAL": 4, "HIGH": 3, "MEDIUM": 2, "LOW": 1}
+# Where findings live: Snyk (single and multi-project output) and Trivy
+FINDING_PREFIXES = (
+    "vulnerabilities.item",
+    "item.vulnerabilities.item",
+    "Results.item.Vulnerabilities.item",
+)
+
+# key -> (expires_at, result)
+scan_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+inflight_scans = {}
+# tool -> (expires_at, version)
+db_versions = {}
+
+async def run_command(*cmd):
+    """
+    Run a command without blocking the event loop.
+    Returns (return_code, stdout, stderr) with output decoded as text.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+async def resolve_image_digest(target: str):
+    """
+    Resolve an image reference to its local content-addressed ID, so a
+    moving tag such as :latest never serves a stale cached scan.
+    Returns None for project directories or images that are not present locally.
+    """
+    if not target or os.path.exists(target):
+        return None
+    try:
+        return_code, stdout, _ = await run_command("docker", "image", "inspect", "--format", "{{.Id}}", target)
+    except OSError:
+        return None
+    return stdout.strip() if return_code == 0 and stdout.strip() else None
+
+async def vuln_db_version(tool: str) -> str:
+    """
+    Identify the vulnerability data a scan would use: Trivy's local DB
+    update time, or the Snyk CLI version (its DB is server-side, so the
+    cache TTL bounds staleness there).
+    """
+    cached = db_versions.get(tool)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    version = "unknown"
+    try:
+        if tool == "trivy":
+            return_code, stdout, _ = await run_command("trivy", "version", "--format", "json")
+            if return_code == 0:
+                db = json.loads(stdout).get("VulnerabilityDB") or {}
+                version = f"{db.get('Version')}:{db.get('UpdatedAt')}"
+        else:
+            return_code, stdout, _ = await run_command("snyk", "--version")
+            if return_code == 0:
+                version = stdout.strip()
+    except (OSError, ValueError) as e:
+        global_logger.warning(f"Could not determine {tool} DB version: {e}")
+    db_versions[tool] = (time.monotonic() + DB_VERSION_TTL, version)
+    return version
+
+def iter_findings(report_file):
+    """
+    Yield vulnerability objects from a Snyk or Trivy JSON report one at a
+    time. With ijson only one finding is held in memory at once.
+    """
+    if ijson is None:
+        report = json.load(report_file)
+        projects = report if isinstance(report, list) else [report]
+        for project in projects:
+            yield from project.get("vulnerabilities") or project.get("issues") or []
+            for result in project.get("Results") or []:
+                yield from result.get("Vulnerabilities") or []
+        return
+
+    builder = None
+    current = None
+    for prefix, event, value in ijson.parse(report_file):
+        if builder is None:
+            if event == "start_map" and prefix in FINDING_PREFIXES:
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                current = prefix
+            continue
+        builder.event(event, value)
+        if event == "end_map" and prefix == current:
+            yield builder.value
+            builder = None
+
+def normalize_finding(finding: dict) -> dict:
+    fixed_in = finding.get("FixedVersion") or finding.get("fixedIn") or []
+    if isinstance(fixed_in, str):
+        fixed_in = [v.strip() for v in fixed_in.split(",") if v.strip()]
+    return {
+        "id": finding.get("VulnerabilityID") or finding.get("id"),
+        "package": finding.get("PkgName") or finding.get("packageName"),
+        "version": finding.get("InstalledVersion") or finding.get("version"),
+        "severity": str(finding.get("Severity") or finding.get("severity") or "unknown").upper(),
+        "title": finding.get("Title") or finding.get("title"),
+        "fixedIn": fixed_in,
+    }
+
+def summarize_report(report_path: str) -> dict:
+    """
+    Build a compact summary of a scan report: counts by severity, the
+    REPORT_TOP_N most severe findings and the packages that have a fix.
+    """
+    counts = {}
+    top = []
+    fixable = set()
+    total = 0
+    with open(report_path, "rb") as f:
+        for seq, finding in enumerate(iter_findings(f)):
+            finding = normalize_finding(finding)
+            total += 1
+            counts[finding["severity"]] = counts.get(finding["severity"], 0) + 1
+            if finding["fixedIn"] and finding["package"]:
+                fixable.add(finding["package"])
+            # Keep the N most severe; earlier findings win ties
+            item = (SEVERITY_RANK.get(finding["severity"], 0), -seq, finding)
+            if len(top) < REPORT_TOP_N:
+                heapq.heappush(top, item)
+            elif item[:2] > top[0][:2]:
+                heapq.heapreplace(top, item)
+    return {
+        "total": total,
+        "bySeverity": counts,
+        "top": [item[2] for item in sorted(top, key=lambda item: item[:2], reverse=True)],
+        "fixablePackages": sorted(fixable)[:REPORT_MAX_FIXABLE],
+        "fixableCount": len(fixable),
+    }
+
+async def scan(tool: str, target: str) -> dict:
     """
     Executes a security dependency scan (e.g., using Snyk or Trivy).
-    Expects payload fields:
-      - target: str (image or project directory)
-    Returns status, logs, and any vulnerability summary.
+    The JSON report is streamed straight to a file under REPORT_DIR, kept
+    there and summarized from it; stderr is kept apart as a bounded log tail.
+    Returns status, logs, summary and the report path.
     """
-    target = task_payload.get("target")
-    tool = task_payload.get("tool", "snyk")
     if tool == "trivy":
         cmd = ["trivy", "image", target, "--format", "json"]
     else:
@@ -34,20 +193,86 @@ async def run_security_scan(task_payload: dict) -> dict:
         cmd = ["snyk", "container", "test", target, "--json"]
     global_logger.info(f"Running security scan: {' '.join(cmd)}")
 
-    proc = Popen(cmd, stdout=PIPE, stderr=STDOUT, text=True)
-    stdout, _ = proc.communicate()
-    return_code = proc.returncode
+    report_dir = os.path.join(REPORT_DIR, time.strftime("%Y-%m-%d", time.gmtime()))
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"{tool}-{uuid.uuid4().hex}.json")
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    with open(report_path, "wb") as report_file:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=report_file,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        async for raw in proc.stderr:
+            stderr_tail.append(raw.decode(errors="replace").rstrip("\n"))
+        return_code = await proc.wait()
     status = "pass" if return_code == 0 else "fail"
 
-    # Attempt to parse JSON output for summary
     summary = {}
+    parsed = False
     try:
-        report = json.loads(stdout)
-        summary = report.get("vulnerabilities") or report.get("issues") or []
-    except json.JSONDecodeError:
-        global_logger.warning("Could not parse security scan JSON output.")
+        summary = await asyncio.to_thread(summarize_report, report_path)
+        parsed = True
+    except Exception as e:
+        global_logger.warning(f"Could not parse security scan JSON output: {e}")
+
+    return {
+        "status": status,
+        "logs": "\n".join(stderr_tail),
+        "summary": summary,
+        "reportRef": report_path,
+        "complete": parsed,
+    }
+
+async def run_security_scan(task_payload: dict) -> dict:
+    """
+    Scan a target, reusing a recent result for the same image digest and
+    vulnerability DB, and sharing one scan between concurrent identical requests.
+    Expects payload fields:
+      - target: str (image or project directory)
+      - tool: "snyk" | "trivy" (optional, default "snyk")
+    Returns status, stderr tail, vulnerability summary and report path.
+    """
+    target = task_payload.get("target")
+    tool = task_payload.get("tool", "snyk")
 
-    return {"status": status, "logs": stdout, "summary": summary}
+    digest = await resolve_image_digest(target)
+    if digest:
+        key = (tool, digest, await vuln_db_version(tool))
+    else:
+        # Nothing stable to cache on; still share an identical in-flight scan
+        key = (tool, target, None)
+
+    entry = scan_cache.get(key)
+    if entry is not None:
+        if entry[0] > time.monotonic():
+            scan_cache.move_to_end(key)
+            global_logger.info(f"Scan cache hit for {target} ({tool}, {digest})")
+            return dict(entry[1], cache={"hit": True, "digest": digest})
+        del scan_cache[key]
+    if key in inflight_scans:
+        global_logger.info(f"Joining in-flight scan for {target} ({tool})")
+        result = await asyncio.shield(inflight_scans[key])
+        return dict(result, cache={"hit": True, "digest": digest})
+
+    future = asyncio.get_running_loop().create_future()
+    inflight_scans[key] = future
+    try:
+        result = await scan(tool, target)
+        # Only cache scans that produced a report, never tool or network errors
+        if result.pop("complete") and digest:
+            scan_cache[key] = (time.monotonic() + SCAN_CACHE_TTL, result)
+            while len(scan_cache) > SCAN_CACHE_SIZE:
+                scan_cache.popitem(last=False)
+        future.set_result(result)
+        return dict(result, cache={"hit": False, "digest": digest})
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so the exception is not reported again when nobody joined
+        future.exception()
+        raise
+    finally:
+        del inflight_scans[key]
 
 async def message_handler(msg):
     try:
@@ -62,7 +287,12 @@ async def message_handler(msg):
             "runId": run_id,
             "taskId": task_id,
             "status": result["status"],
-            "output": {"logs": result["logs"], "summary": result.get("summary", [])}
+            "output": {
+                "logs": result["logs"],
+                "summary": result.get("summary", {}),
+                "reportRef": result.get("reportRef"),
+                "cache": result.get("cache"),
+            }
         }
 
         await msg.respond(json.dumps(response).encode())
@@ -1,10 +1,19 @@
 import os
 import sys
+import heapq
+import shutil
 import asyncio
 import json
 import logging
+import hashlib
+import tempfile
 from nats.aio.client import Client as NATS
 
+try:
+    from coverage import CoverageData
+except ImportError:  # optional: test-impact selection is disabled without coverage
+    CoverageData = None
+
 # Configure logging
 global_logger = logging.getLogger("test_agent")
 global_logger.setLevel(logging.INFO)
@@ -16,43 +25,397 @@ global_logger.addHandler(handler)
 # Environment variables
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 SUBJECT = "task.pytest.request"
+# Each test task runs in its own scratch directory under this root
+SCRATCH_ROOT = os.getenv("TEST_SCRATCH_ROOT", tempfile.gettempdir())
+# Per-file test durations from earlier runs, used for duration-based sharding,
+# keyed by absolute file path
+DURATIONS_PATH = os.getenv("TEST_DURATIONS_PATH", "/tmp/test-agent/durations.json")
+# Upper bound on shards run in parallel on this agent
+MAX_PARALLEL_SHARDS = int(os.getenv("TEST_MAX_PARALLEL_SHARDS", str(os.cpu_count() or 2)))
+
+# Test-impact selection: per-test coverage map stored under this directory
+TEST_IMPACT_ENABLED = os.getenv("TEST_IMPACT", "on").lower() not in ("0", "off", "false")
+TEST_IMPACT_DIR = os.getenv("TEST_IMPACT_DIR", "/tmp/test-agent/impact")
+# Force a full run (and a fresh coverage map) after this many selective runs
+TEST_IMPACT_FULL_EVERY = int(os.getenv("TEST_IMPACT_FULL_EVERY", "20"))
+# Changes to these files can affect any test, so they always trigger a full run
+GLOBAL_TEST_FILES = ("conftest.py", "pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini", "requirements.txt")
+
+shard_slots = asyncio.Semaphore(MAX_PARALLEL_SHARDS)
+
+def _norm(file_path: str, root: str) -> str:
+    """
+    `file_path` (absolute, or relative to `root`) as a path relative to the
+    pytest rootdir `root`, the form pytest uses in node IDs.
+    """
+    return os.path.relpath(os.path.join(root, file_path), root).replace(os.sep, "/")
+
+def _is_test_file(file_path: str) -> bool:
+    name = os.path.basename(file_path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+class ImpactIndex:
+    """
+    Per-suite map from source file to the tests that executed it, built from
+    `pytest --cov-context=test` runs, plus the tests that failed last time.
+
+    Files and node IDs are kept relative to the pytest rootdir (`root`, taken
+    from the JSON report of the last full run), never to the agent's working
+    directory. Stored as compact JSON: test node IDs are listed once and
+    files refer to them by position.
+    """
+
+    def __init__(self, path: str):
+        suite_key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        self.index_path = os.path.join(TEST_IMPACT_DIR, f"{suite_key}.json")
+        self.files = {}
+        self.test_files = set()
+        self.failed = set()
+        self.runs_since_full = 0
+        self.root = None
+        self.loaded = False
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        tests = data.get("tests", [])
+        self.files = {name: {tests[i] for i in ids} for name, ids in data.get("files", {}).items()}
+        self.test_files = set(data.get("testFiles", []))
+        self.failed = set(data.get("failed", []))
+        self.runs_since_full = data.get("runsSinceFull", 0)
+        self.root = data.get("root")
+        self.loaded = True
+        return self
+
+    def save(self):
+        tests = sorted(set().union(*self.files.values())) if self.files else []
+        position = {test: i for i, test in enumerate(tests)}
+        data = {
+            "tests": tests,
+            "files": {name: sorted(position[t] for t in ids) for name, ids in self.files.items()},
+            "testFiles": sorted(self.test_files),
+            "failed": sorted(self.failed),
+            "runsSinceFull": self.runs_since_full,
+            "root": self.root,
+        }
+        os.makedirs(TEST_IMPACT_DIR, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+
+    def needs_full_run(self, changed_files) -> bool:
+        if not self.loaded or not self.root or self.runs_since_full >= TEST_IMPACT_FULL_EVERY:
+            return True
+        return any(os.path.basename(f) in GLOBAL_TEST_FILES for f in changed_files)
+
+    def select(self, path: str, changed_files):
+        """
+        Return the tests affected by `changed_files` (relative to the pytest
+        rootdir, or absolute): tests that covered a changed file, changed or
+        new test files, and previously failed tests. Node IDs are relative
+        to `root`.
+        """
+        selected = set()
+        for file_path in (_norm(f, self.root) for f in changed_files):
+            if _is_test_file(file_path):
+                selected.add(file_path)
+            selected.update(self.files.get(file_path, ()))
+        for test_file in discover_test_files(path):
+            test_file = _norm(os.path.abspath(test_file), self.root)
+            if test_file not in self.test_files:
+                selected.add(test_file)
+        selected.update(self.failed)
+        # Drop node IDs whose test file has since been deleted
+        return sorted(
+            t for t in selected if os.path.exists(os.path.join(self.root, t.split("::")[0]))
+        )
+
+    def update(self, contexts: dict, reports, full: bool, path: str, root: str):
+        """
+        Fold a run's coverage contexts ({test: files}) and outcomes in. A full
+        run replaces the map and its rootdir; a selective run refreshes only
+        the tests it ran.
+        """
+        if full:
+            self.root = root
+            self.files = {}
+            self.failed = set()
+            self.test_files = {_norm(os.path.abspath(f), root) for f in discover_test_files(path)}
+            self.runs_since_full = 0
+        else:
+            for tests in self.files.values():
+                tests.difference_update(contexts)
+            self.runs_since_full += 1
+        for test, files in contexts.items():
+            self.test_files.add(test.split("::")[0])
+            for file_path in files:
+                self.files.setdefault(file_path, set()).add(test)
+        self.files = {name: tests for name, tests in self.files.items() if tests}
+        for report in reports:
+            for test in report.get("tests", []):
+                if test.get("outcome") in ("failed", "error"):
+                    self.failed.add(test["nodeid"])
+                else:
+                    self.failed.discard(test["nodeid"])
+
+def read_coverage_contexts(coverage_file: str, root: str) -> dict:
+    """
+    Invert a coverage data file recorded with --cov-context=test into
+    {test node ID: set of source files it executed}, with files relative to
+    the pytest rootdir `root`. Files outside it are left out.
+    """
+    data = CoverageData(basename=coverage_file)
+    data.read()
+    contexts = {}
+    for measured in data.measured_files():
+        file_path = _norm(measured, root)
+        if file_path.startswith("../"):
+            continue
+        for line_contexts in data.contexts_by_lineno(measured).values():
+            for context in line_contexts:
+                test = context.rsplit("|", 1)[0]
+                if test:
+                    contexts.setdefault(test, set()).add(file_path)
+    return contexts
+
+def discover_test_files(path: str):
+    """
+    List pytest files under `path` (test_*.py / *_test.py), sorted.
+    A file path is returned as-is.
+    """
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py")):
+                found.append(os.path.join(root, name))
+    return found
+
+def load_durations() -> dict:
+    try:
+        with open(DURATIONS_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _duration_key(target: str, root: str = None) -> str:
+    """
+    Absolute path of the file a test target or node ID belongs to, resolving
+    relative paths against `root` (default: the working directory).
+    """
+    return os.path.normpath(os.path.join(root or os.getcwd(), target.split("::")[0]))
+
+def save_durations(reports):
+    """
+    Fold per-file durations from pytest-json-report reports into the index.
+    Node IDs are relative to the report's rootdir.
+    """
+    durations = load_durations()
+    for report in reports:
+        per_file = {}
+        for test in report.get("tests", []):
+            file_path = _duration_key(test.get("nodeid", ""), report.get("root"))
+            spent = sum((test.get(stage) or {}).get("duration", 0.0) for stage in ("setup", "call", "teardown"))
+            per_file[file_path] = per_file.get(file_path, 0.0) + spent
+        durations.update(per_file)
+    os.makedirs(os.path.dirname(DURATIONS_PATH) or ".", exist_ok=True)
+    tmp_path = DURATIONS_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(durations, f)
+    os.replace(tmp_path, DURATIONS_PATH)
+
+def split_shards(files, count: int, shard_by: str = "file"):
+    """
+    Split test files into `count` shards: round-robin by file, or, with
+    shard_by="duration", greedily balanced by recorded durations (files
+    without history count as the median known duration).
+    """
+    if not files:
+        return []
+    count = max(1, min(count, len(files)))
+    if shard_by != "duration":
+        return [files[i::count] for i in range(count)]
+
+    recorded = load_durations()
+    durations = {f: recorded[_duration_key(f)] for f in files if _duration_key(f) in recorded}
+    known = sorted(durations.values())
+    default = known[len(known) // 2] if known else 1.0
+    weighted = sorted(files, key=lambda f: durations.get(f, default), reverse=True)
+    shards = [[] for _ in range(count)]
+    heap = [(0.0, i) for i in range(count)]
+    for file_path in weighted:
+        load, i = heapq.heappop(heap)
+        shards[i].append(file_path)
+        heapq.heappush(heap, (load + durations.get(file_path, default), i))
+    return [sorted(shard) for shard in shards]
+
+def summarize(report: dict) -> dict:
+    summary = report.get("summary", {})
+    return {
+        "total": summary.get("total", 0),
+        "passed": summary.get("passed", 0),
+        "failed": summary.get("failed", 0),
+        "skipped": summary.get("skipped", 0),
+    }
+
+async def run_pytest(targets, scratch_dir: str, coverage: bool = False, cov_source: str = None):
+    """
+    Run pytest on `targets` with its JSON report, cache and (with `coverage`)
+    per-test coverage data confined to `scratch_dir`. Coverage measures
+    `cov_source`, or every non-library file when it is not set.
+    Returns (return_code, logs, report).
+    """
+    report_path = os.path.join(scratch_dir, "report.json")
+    cmd = [
+        "pytest", *targets,
+        "--json-report", f"--json-report-file={report_path}",
+        "-o", f"cache_dir={os.path.join(scratch_dir, '.pytest_cache')}",
+    ]
+    env = None
+    if coverage:
+        cmd += [f"--cov={cov_source}" if cov_source else "--cov", "--cov-context=test", "--cov-report="]
+        env = dict(os.environ, COVERAGE_FILE=os.path.join(scratch_dir, ".coverage"))
+    global_logger.info(f"Running tests: {' '.join(cmd)}")
+
+    async with shard_slots:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+        )
+        stdout, _ = await proc.communicate()
+
+    report = {}
+    try:
+        with open(report_path) as f:
+            report = json.load(f)
+    except Exception:
+        global_logger.warning("Could not parse pytest JSON report.")
+    return proc.returncode, stdout.decode(), report
 
 async def run_tests(task_payload: dict) -> dict:
     """
     Runs pytest on the specified directory or file.
     Expects payload fields:
       - path: str (path to test directory or file)
-    Returns status and test summary.
+      - changed_files: list (optional, run only the tests affected by these
+        files; paths relative to the pytest rootdir or absolute). Per-test
+        coverage is only recorded for requests that carry this field.
+      - cov_source: str (optional, code measured for test-impact selection,
+        default: everything outside the Python installation)
+      - full: bool (optional, ignore changed_files and run everything)
+      - shards: int (optional, split the test files into N parallel runs)
+      - shard_by: "file" | "duration" (optional, default "file")
+      - shard_index: int (optional, run only this shard of `shards`, for
+        spreading one suite across agent replicas)
+    Every run gets its own scratch directory, so concurrent tasks never
+    share report files. Returns status and merged test summary.
     """
     path = task_payload.get("path", "./")
-    cmd = ["pytest", path, "--json-report", "--json-report-file=report.json"]
-    global_logger.info(f"Running tests: {' '.join(cmd)}")
+    shard_count = int(task_payload.get("shards", 1) or 1)
+    shard_index = task_payload.get("shard_index")
+    changed_files = task_payload.get("changed_files")
 
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-    stdout, _ = await proc.communicate()
-    logs = stdout.decode()
-    return_code = proc.returncode
-    status = "pass" if return_code == 0 else "fail"
-
-    # Parse JSON report if exists
-    summary = {}
-    try:
-        with open("report.json") as f:
-            report = json.load(f)
-            summary = {
-                "total": report.get("summary", {}).get("total", 0),
-                "passed": report.get("summary", {}).get("passed", 0),
-                "failed": report.get("summary", {}).get("failed", 0),
-                "skipped": report.get("summary", {}).get("skipped", 0),
+    impact = None
+    selected = None
+    if TEST_IMPACT_ENABLED and CoverageData is not None and changed_files is not None:
+        impact = await asyncio.to_thread(ImpactIndex(path).load)
+        if not task_payload.get("full") and not impact.needs_full_run(changed_files):
+            selected = impact.select(path, changed_files)
+            global_logger.info(f"Test-impact selection: {len(selected)} target(s) for {len(changed_files)} changed file(s)")
+    cov_source = task_payload.get("cov_source")
+
+    if selected is not None:
+        # Node IDs are relative to the rootdir; pytest runs from our cwd.
+        # An empty selection means no test is affected: nothing to run.
+        targets = [os.path.join(impact.root, test) for test in selected]
+        shards = split_shards(targets, shard_count, task_payload.get("shard_by", "file"))
+    elif shard_count > 1:
+        test_files = discover_test_files(path)
+        if not test_files:
+            return {
+                "status": "fail",
+                "logs": f"No test files found under {path}",
+                "summary": {"total": 0, "passed": 0, "failed": 0, "skipped": 0},
             }
-    except Exception:
-        global_logger.warning("Could not parse pytest JSON report.")
+        shards = split_shards(test_files, shard_count, task_payload.get("shard_by", "file"))
+    else:
+        shards = [[path]]
+    if shard_index is not None and (shard_count > 1 or selected is not None):
+        shards = [shards[int(shard_index)]] if int(shard_index) < len(shards) else []
+
+    contexts = {}
+    scratch_root = tempfile.mkdtemp(prefix="test-agent-", dir=SCRATCH_ROOT)
+    try:
+        scratch_dirs = []
+        for i in range(len(shards)):
+            scratch_dirs.append(os.path.join(scratch_root, f"shard-{i}"))
+            os.makedirs(scratch_dirs[-1])
+        results = await asyncio.gather(*(
+            run_pytest(targets, scratch_dir, impact is not None, cov_source)
+            for targets, scratch_dir in zip(shards, scratch_dirs)
+        ))
+        # pytest's rootdir, which node IDs and coverage paths are relative to
+        root = next((report["root"] for _, _, report in results if report.get("root")), None)
+        root = root or (impact.root if impact is not None else None) or os.path.abspath(
+            path if os.path.isdir(path) else os.path.dirname(path) or "."
+        )
+        if impact is not None:
+            for scratch_dir in scratch_dirs:
+                coverage_file = os.path.join(scratch_dir, ".coverage")
+                if os.path.exists(coverage_file):
+                    for test, files in (await asyncio.to_thread(read_coverage_contexts, coverage_file, root)).items():
+                        contexts.setdefault(test, set()).update(files)
+    finally:
+        shutil.rmtree(scratch_root, ignore_errors=True)
+
+    summary = {"total": 0, "passed": 0, "failed": 0, "skipped": 0}
+    shard_results = []
+    logs = []
+    for i, (targets, (return_code, shard_logs, report)) in enumerate(zip(shards, results)):
+        shard_summary = summarize(report)
+        for key in summary:
+            summary[key] += shard_summary[key]
+        shard_results.append({
+            "index": i if shard_index is None else int(shard_index),
+            "targets": targets,
+            "status": "pass" if return_code == 0 else "fail",
+            "summary": shard_summary,
+        })
+        logs.append(shard_logs if len(shards) == 1 else f"=== shard {i}: {' '.join(targets)}\n{shard_logs}")
+
+    reports = [report for _, _, report in results if report]
+    if reports and shard_count > 1:
+        try:
+            save_durations(reports)
+        except OSError as e:
+            global_logger.warning(f"Could not update test durations: {e}")
+
+    # A partial shard of a full run only covers part of the suite, so it
+    # must not replace the whole map
+    if impact is not None and reports and (selected is not None or shard_index is None):
+        try:
+            impact.update(contexts, reports, full=selected is None, path=path, root=root)
+            await asyncio.to_thread(impact.save)
+        except Exception as e:
+            global_logger.warning(f"Could not update test-impact index: {e}")
 
-    return {"status": status, "logs": logs, "summary": summary}
+    status = "pass" if all(r["status"] == "pass" for r in shard_results) else "fail"
+    result = {"status": status, "logs": "\n".join(logs), "summary": summary}
+    if shard_count > 1:
+        result["shards"] = shard_results
+    if selected is not None:
+        result["selection"] = {"mode": "impact", "targets": len(selected), "changedFiles": len(changed_files)}
+    elif impact is not None and changed_files is not None:
+        result["selection"] = {"mode": "full"}
+    return result
 
 async def message_handler(msg):
     try:
@@ -69,6 +432,9 @@ async def message_handler(msg):
             "status": result["status"],
             "output": {"logs": result["logs"], "summary": result.get("summary", {})}
         }
+        for key in ("shards", "selection"):
+            if key in result:
+                response["output"][key] = result[key]
 
         await msg.respond(json.dumps(response).encode())
         global_logger.info(f"Published test response for task {task_id} (status={result['status']})")
@@ -0,0 +1,115 @@
+# examples/bench_bus.py
+#
+# Micro-benchmark for NATSPubSub publishing and message decoding.
+#
+# Run it as a module from the repository root, so `orchestrator` is importable:
+#
+#   python -m examples.bench_bus                      # simulated 0.5 ms round-trip
+#   python -m examples.bench_bus --rtt-ms 2
+#   python -m examples.bench_bus --url nats://localhost:4222
+#
+# Compares messages per second for flush-per-message publish (the old
+# behaviour), publish_many and pipelined publish, and the old yaml.safe_load
+# decode path against the shared wire codec.
+
+import argparse
+import asyncio
+import time
+
+import yaml
+
+from orchestrator.bus import NATSPubSub
+from orchestrator.codec import decode_message, encode_message
+
+
+class SimulatedConnection:
+    """
+    Stand-in for a NATS client: publish buffers, flush costs one round-trip.
+    """
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.published = 0
+
+    async def publish(self, subject, data, reply=""):
+        self.published += 1
+
+    async def flush(self):
+        await asyncio.sleep(self.rtt)
+
+
+def task_message(i: int):
+    task = {"id": f"task-{i}", "type": "pytest", "path": "tests/", "needs": ["build"]}
+    return "task.pytest.request", {"runId": "bench", "taskId": task["id"], "payload": task}, "task.pytest.response"
+
+
+async def bench_publish(nc, count: int):
+    messages = [task_message(i) for i in range(count)]
+    results = {}
+
+    bus = NATSPubSub(nc, tracer=None)
+    start = time.perf_counter()
+    for subject, payload, reply in messages:
+        await bus.publish(subject, payload, reply=reply)
+    results["publish + flush per message"] = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await bus.publish_many(messages)
+    results["publish_many"] = count / (time.perf_counter() - start)
+
+    bus = NATSPubSub(nc, tracer=None, pipelined=True)
+    start = time.perf_counter()
+    for subject, payload, reply in messages:
+        await bus.publish(subject, payload, reply=reply)
+    await nc.flush()
+    results["pipelined publish"] = count / (time.perf_counter() - start)
+    return results
+
+
+def bench_decode(count: int):
+    result = {
+        "runId": "bench",
+        "taskId": "unit_tests",
+        "status": "pass",
+        "output": {"logs": "collected 120 items\n" * 50, "summary": {"total": 120, "passed": 120}},
+    }
+    data = encode_message(result)
+    results = {}
+    start = time.perf_counter()
+    for _ in range(count):
+        yaml.safe_load(data.decode())
+    results["yaml.safe_load"] = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(count):
+        decode_message(data)
+    results["decode_message"] = count / (time.perf_counter() - start)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="NATS server; omit to simulate the connection")
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="simulated flush round-trip")
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.url:
+        from nats.aio.client import Client as NATS
+        nc = NATS()
+        await nc.connect(servers=[args.url])
+    else:
+        nc = SimulatedConnection(args.rtt_ms / 1000)
+
+    print(f"Publishing {args.count} task messages")
+    for name, rate in (await bench_publish(nc, args.count)).items():
+        print(f"  {name:<30} {rate:>12,.0f} msg/s")
+    print(f"Decoding {args.count // 4} task results")
+    for name, rate in bench_decode(args.count // 4).items():
+        print(f"  {name:<30} {rate:>12,.0f} msg/s")
+
+    if args.url:
+        await nc.drain()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
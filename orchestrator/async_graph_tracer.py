@@ -0,0 +1,288 @@
+# orchestrator/async_graph_tracer.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from neo4j import AsyncGraphDatabase, AsyncDriver
+
+from orchestrator.codec import StorageCodec
+from orchestrator.metrics import TRACER_WRITE
+
+from orchestrator.graph_tracer import (
+    CREATE_RUN_CYPHER,
+    CREATE_TASKS_CYPHER,
+    FAIL_RUN_CYPHER,
+    GET_RUN_SPEC_CYPHER,
+    GET_RUN_TASKS_CYPHER,
+    GET_WORKFLOW_SPEC_CYPHER,
+    GET_WORKFLOW_VERSION_CYPHER,
+    LIST_WORKFLOWS_CYPHER,
+    MARK_RUNNING_CYPHER,
+    MERGE_WORKFLOW_CYPHER,
+    RECORD_PATCHES_CYPHER,
+    RECORD_RESULTS_CYPHER,
+    RESET_TASKS_CYPHER,
+    RUN_STATUS_CYPHER,
+    SET_RUN_SPEC_CYPHER,
+    WriteBuffer,
+    patch_row,
+    patch_spec,
+    result_row,
+    retry_rows,
+    run_status,
+    run_tasks,
+    task_row,
+    workflow_listing,
+)
+
+logger = logging.getLogger("orchestrator.graph_tracer")
+
+
+class AsyncGraphTracer:
+    """
+    asyncio-native counterpart of GraphTracer built on the async Neo4j driver.
+
+    Exposes the same methods as coroutines so FastAPI handlers and NATS
+    callbacks can await Neo4j without stalling the event loop. Connection
+    pool size and lifetime are passed through to the driver. Write-behind
+    buffering behaves as in GraphTracer, with the flush timer running as an
+    asyncio task instead of a thread.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        pwd: str,
+        buffered: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_connection_pool_size: int = 100,
+        max_connection_lifetime: float = 3600,
+        codec: Optional[StorageCodec] = None,
+    ):
+        self._codec = codec or StorageCodec()
+        self._driver: AsyncDriver = AsyncGraphDatabase.driver(
+            uri,
+            auth=(user, pwd),
+            max_connection_pool_size=max_connection_pool_size,
+            max_connection_lifetime=max_connection_lifetime,
+        )
+        self._buffered = buffered
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer = WriteBuffer()
+        # Serializes flushes so batches commit in the order they were queued
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def close(self):
+        await self.flush()
+        await self._driver.close()
+
+    async def _enqueue(self, kind: str, row: Dict[str, Any]):
+        getattr(self._buffer, kind).append(row)
+        if len(self._buffer) >= self._batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_on_timer())
+
+    async def _flush_on_timer(self):
+        await asyncio.sleep(self._flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Write-behind flush failed, will retry: %s", e)
+            if self._timer is None:
+                self._timer = asyncio.create_task(self._flush_on_timer())
+
+    async def flush(self):
+        """
+        Write all buffered rows to Neo4j in a single transaction. On failure the
+        rows are put back in the buffer and the error is re-raised.
+        """
+        async with self._flush_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._buffer = self._buffer, WriteBuffer()
+            if not len(batch):
+                return
+            started = time.monotonic()
+            try:
+                async with self._driver.session() as ses:
+                    await ses.execute_write(self._write_batch, batch)
+                TRACER_WRITE.observe(time.monotonic() - started, "flush")
+            except Exception:
+                self._buffer.prepend(batch)
+                raise
+
+    async def _write_batch(self, tx, batch: WriteBuffer):
+        for cypher, params in batch.statements(self._batch_size):
+            result = await tx.run(cypher, **params)
+            async for rec in result:
+                logger.info("Run %s completed with status %s", rec["runId"], rec["status"])
+
+    async def _run(self, cypher: str, **params):
+        started = time.monotonic()
+        async with self._driver.session() as ses:
+            result = await ses.run(cypher, **params)
+            await result.consume()
+        TRACER_WRITE.observe(time.monotonic() - started, "statement")
+
+    async def _single(self, cypher: str, **params):
+        started = time.monotonic()
+        async with self._driver.session() as ses:
+            result = await ses.run(cypher, **params)
+            rec = await result.single()
+        TRACER_WRITE.observe(time.monotonic() - started, "statement")
+        return rec
+
+    async def create_workflow_node(self, workflow_id: str, spec: Dict[str, Any]) -> int:
+        """
+        Create or update a Workflow node with its encoded spec.
+        Returns the Workflow's new version.
+        """
+        rec = await self._single(
+            MERGE_WORKFLOW_CYPHER,
+            workflow_id=workflow_id,
+            spec=self._codec.encode(spec),
+            schedule=spec.get("schedule", "")
+        )
+        return rec["version"]
+
+    async def list_workflows(self) -> List[Dict[str, str]]:
+        """
+        Return list of workflows with id, name, and schedule.
+        """
+        async with self._driver.session() as ses:
+            result = await ses.run(LIST_WORKFLOWS_CYPHER)
+            return [workflow_listing(self._codec, rec) async for rec in result]
+
+    async def get_workflow(self, workflow_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Retrieve the version and full spec for given workflow.
+        """
+        rec = await self._single(GET_WORKFLOW_SPEC_CYPHER, workflow_id=workflow_id)
+        if not rec:
+            return None
+        return rec["version"], self._codec.decode(rec["spec"])
+
+    async def get_workflow_spec(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the full spec for given workflow.
+        """
+        found = await self.get_workflow(workflow_id)
+        return found[1] if found else None
+
+    async def get_workflow_version(self, workflow_id: str) -> Optional[int]:
+        """
+        Retrieve only the current version of a workflow, without its spec.
+        """
+        rec = await self._single(GET_WORKFLOW_VERSION_CYPHER, workflow_id=workflow_id)
+        return rec["version"] if rec else None
+
+    async def create_run_node(
+        self, run_id: str, workflow_id: str, spec: Dict[str, Any], overrides: Dict[str, Any]
+    ):
+        """
+        Record a new Run node linked to its Workflow.
+        """
+        await self._run(
+            CREATE_RUN_CYPHER,
+            run_id=run_id,
+            workflow_id=workflow_id,
+            spec=self._codec.encode(spec),
+            overrides=self._codec.encode(overrides)
+        )
+
+    async def fail_run(self, run_id: str, reason: str):
+        """
+        Mark a still-running Run as failed without any task results.
+        """
+        await self.flush()
+        await self._run(FAIL_RUN_CYPHER, run_id=run_id, reason=reason)
+
+    async def get_run_status(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch Run node and its Task statuses.
+        """
+        await self.flush()
+        rec = await self._single(RUN_STATUS_CYPHER, run_id=run_id)
+        if not rec:
+            return None
+        return run_status(rec)
+
+    async def create_task_node(self, run_id: str, task_id: str, task_payload: Dict[str, Any]):
+        """
+        Record a Task node for a given Run.
+        """
+        row = task_row(self._codec, run_id, task_id, task_payload)
+        if self._buffered:
+            await self._enqueue("tasks", row)
+            return
+        await self._run(CREATE_TASKS_CYPHER, rows=[row])
+
+    async def mark_tasks_running(self, run_id: str, task_ids: List[str]):
+        """
+        Move pending Tasks of a Run to 'running' as they are dispatched.
+        """
+        rows = [{"run_id": run_id, "task_id": task_id} for task_id in task_ids]
+        if self._buffered:
+            for row in rows:
+                await self._enqueue("running", row)
+            return
+        await self._run(MARK_RUNNING_CYPHER, rows=rows)
+
+    async def record_task_result(
+        self, run_id: str, task_id: str, status: str, output: Any
+    ) -> Optional[str]:
+        """
+        Update Task node status and output, mark Run completed if all done.
+        Returns the Run's final status if this result completed it. Buffered
+        writes return None; completion is logged when the batch is flushed.
+        """
+        row = result_row(self._codec, run_id, task_id, status, output)
+        if self._buffered:
+            await self._enqueue("results", row)
+            return None
+        rec = await self._single(RECORD_RESULTS_CYPHER, rows=[row])
+        return rec["status"] if rec else None
+
+    async def record_patch(self, run_id: str, task_id: str, updates: Dict[str, Any]):
+        """
+        Record that an AutoFix patch was applied to a Task.
+        """
+        row = patch_row(self._codec, run_id, task_id, updates)
+        if self._buffered:
+            await self._enqueue("patches", row)
+            return
+        await self._run(RECORD_PATCHES_CYPHER, rows=[row])
+
+    async def get_run_tasks(self, run_id: str) -> List[Tuple[Dict[str, Any], str]]:
+        """
+        Fetch the (task spec, status) pairs recorded for a Run.
+        """
+        await self.flush()
+        async with self._driver.session() as ses:
+            result = await ses.run(GET_RUN_TASKS_CYPHER, run_id=run_id)
+            return run_tasks(self._codec, [rec async for rec in result])
+
+    async def apply_patch(self, run_id: str, task_id: str, updates: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Patch a task of the run and reset it and its transitive dependents to
+        pending, reopening the run if it had completed. Returns those tasks;
+        every other task keeps its recorded status and output.
+        """
+        await self.flush()
+        rec = await self._single(GET_RUN_SPEC_CYPHER, run_id=run_id)
+        spec, encoded = patch_spec(self._codec, rec["spec"], task_id, updates)
+        await self._run(SET_RUN_SPEC_CYPHER, run_id=run_id, spec=encoded)
+        tasks = [task for task, _ in await self.get_run_tasks(run_id)]
+        rows, retry = retry_rows(self._codec, run_id, tasks, task_id, updates)
+        if rows:
+            await self._run(RESET_TASKS_CYPHER, rows=rows)
+        return retry
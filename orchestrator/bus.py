@@ -1,21 +1,83 @@
 # orchestrator/bus.py
 
 import asyncio
-import json
+import logging
+import time
 import uuid
-import yaml
+from typing import Iterable, Optional, Tuple
 from nats.aio.client import Client as NATS
-from orchestrator.graph_tracer import GraphTracer
+from orchestrator.async_graph_tracer import AsyncGraphTracer
+from orchestrator.codec import encode_message
+from orchestrator.compliance import PolicyEngine
+from orchestrator.metrics import PLAN_LATENCY, TASK_EXECUTION, TASK_QUEUE_WAIT
+from orchestrator.run_state import RunStateStore
+from orchestrator.scheduler import DagError, DagScheduler, validate_dag
+
+logger = logging.getLogger("orchestrator.bus")
 
 class NATSPubSub:
     """
     Wrapper around NATS for publishing and subscribing workflow events,
     dispatching tasks, handling runs, and applying auto-fix patches.
+
+    By default every `publish` waits for a flush round-trip. In pipelined
+    mode publishes return immediately and a single deferred flush covers
+    every message published in the same event-loop turn; `publish_many`
+    always flushes once per batch.
+
+    With a compliance preflight configured, every planned DAG is checked
+    against the compliance policies before any task is dispatched; violating
+    runs are failed outright ("fail") or held while auto-fix patches the
+    offending tasks ("autofix").
+
+    Every status change written to the tracer is also applied to the
+    in-memory run-status projection that serves the run-status API.
     """
 
-    def __init__(self, nats: NATS, tracer: GraphTracer):
+    PREFLIGHT_MODES = ("off", "fail", "autofix")
+
+    def __init__(
+        self,
+        nats: NATS,
+        tracer: AsyncGraphTracer,
+        scheduler_config: dict = None,
+        pipelined: bool = False,
+        compliance_config: dict = None,
+        run_state: RunStateStore = None,
+        autofix_timeout: float = None,
+        state_ttl: float = 3600,
+    ):
         self._nc = nats
         self._tracer = tracer
+        self._pipelined = pipelined
+        self._pending_flush: Optional[asyncio.Task] = None
+        scheduler_config = scheduler_config or {}
+        self._max_in_flight = scheduler_config.get("max_in_flight", {})
+        self._default_max_in_flight = scheduler_config.get("default_max_in_flight", 0)
+        # run_id -> DagScheduler for runs that still have tasks in flight
+        self._schedulers = {}
+        # Start times for latency metrics: run_id -> plan request sent,
+        # run_id -> {task_id: (task type, dispatched)}
+        self._plan_started = {}
+        self._dispatched = {}
+        # Per-run state is dropped when a run finishes or fails, and swept
+        # after state_ttl seconds without activity (a planner or agent that
+        # never answers); run_id -> last activity
+        self._state_ttl = state_ttl
+        self._last_activity = {}
+        self._last_sweep = time.monotonic()
+        compliance_config = compliance_config or {}
+        self._preflight = compliance_config.get("preflight", "off")
+        if self._preflight not in self.PREFLIGHT_MODES:
+            raise ValueError(f"Unknown compliance preflight mode '{self._preflight}'")
+        self._max_fix_attempts = compliance_config.get("max_fix_attempts", 2)
+        self._policy = PolicyEngine(max_entries=compliance_config.get("decision_cache_size", 4096))
+        # run_id -> {"dag", "violations": {task_id: [...]}, "attempts": {task_id: n}}
+        # for runs held back by the preflight until auto-fix clears them
+        self._held = {}
+        # Seconds a held run waits for an auto-fix reply before it is failed
+        self._autofix_timeout = autofix_timeout
+        self._runs = run_state or RunStateStore()
 
     async def subscribe(self, subject: str, callback):
         """
@@ -27,15 +89,62 @@ class NATSPubSub:
 
     async def _listener(self, subscription, callback):
         async for msg in subscription.messages:
-            await callback(msg)
+            # One bad message must not end the subscription
+            try:
+                await callback(msg)
+            except Exception:
+                logger.exception("Error handling message on %s", msg.subject)
+
+    async def publish(self, subject: str, payload: dict, reply: str = ""):
+        """
+        Publish a JSON payload to a NATS subject and flush the connection
+        (or schedule a coalesced flush in pipelined mode).
+        """
+        await self._nc.publish(subject, encode_message(payload), reply=reply)
+        if self._pipelined:
+            self._schedule_flush()
+        else:
+            await self._nc.flush()
 
-    async def publish(self, subject: str, payload: dict):
+    async def publish_many(self, messages: Iterable[Tuple[str, dict, str]]):
         """
-        Publish a JSON payload to a NATS subject and flush the connection.
+        Publish (subject, payload, reply) messages back to back and flush the
+        connection once for the whole batch.
         """
-        data = json.dumps(payload).encode()
-        await self._nc.publish(subject, data)
-        await self._nc.flush()
+        count = 0
+        for subject, payload, reply in messages:
+            await self._nc.publish(subject, encode_message(payload), reply=reply)
+            count += 1
+        if count:
+            await self._nc.flush()
+
+    def _schedule_flush(self):
+        if self._pending_flush is None or self._pending_flush.done():
+            self._pending_flush = asyncio.create_task(self._deferred_flush())
+
+    async def _deferred_flush(self):
+        # Yield once so every publish made in this loop turn shares the flush
+        await asyncio.sleep(0)
+        try:
+            await self._nc.flush()
+        except Exception as e:
+            logger.error("Deferred NATS flush failed: %s", e)
+
+    def _task_message(self, run_id: str, task: dict) -> Tuple[str, dict, str]:
+        """
+        Build the request for a single task. Agents answer with `msg.respond`,
+        so the reply subject routes results back to `task.<type>.response`.
+        """
+        task_payload = {
+            "runId": run_id,
+            "taskId": task["id"],
+            "payload": task
+        }
+        return (
+            f"task.{task['type']}.request",
+            task_payload,
+            f"task.{task['type']}.response"
+        )
 
     async def start_run(self, workflow_id: str, spec: dict, overrides: dict) -> str:
         """
@@ -43,50 +152,312 @@ class NATSPubSub:
         Persists run node in Neo4j and publishes plan request.
         """
         run_id = str(uuid.uuid4())
-        self._tracer.create_run_node(run_id, workflow_id, spec, overrides)
+        await self._tracer.create_run_node(run_id, workflow_id, spec, overrides)
+        self._runs.create_run(run_id)
 
         # Send planning request
         plan_payload = {
             "text": spec.get("description", f"Run workflow {workflow_id}"),
             "workflowId": workflow_id,
             "runId": run_id,
+            "spec": spec,
+            "overrides": overrides,
             "replyTo": "workflow.plan.response"
         }
-        await self.publish("workflow.plan.request", plan_payload)
+        self._plan_started[run_id] = self._touch(run_id)
+        await self.publish("workflow.plan.request", plan_payload, reply="workflow.plan.response")
         return run_id
 
+    def plan_received(self, run_id: str):
+        """
+        Record the planning latency of a run whose DAG just arrived.
+        """
+        started = self._plan_started.pop(run_id, None)
+        if started is not None:
+            PLAN_LATENCY.observe(time.monotonic() - started)
+
+    def _run_context(self, tasks):
+        """
+        Policy `input.run` per task: the concurrency a task type can reach in
+        this run (its in-flight cap, or the number of such tasks if uncapped).
+        """
+        per_type = {}
+        for task in tasks:
+            per_type[task.get("type")] = per_type.get(task.get("type"), 0) + 1
+
+        def context(task):
+            cap = self._max_in_flight.get(task.get("type"), self._default_max_in_flight)
+            count = per_type.get(task.get("type"), 0)
+            return {"concurrency": min(cap, count) if cap else count}
+        return context
+
+    async def preflight(self, run_id: str, dag: dict) -> bool:
+        """
+        Check every task of a freshly planned DAG against the compliance
+        policies in one pass. Returns True when the DAG may be dispatched.
+        On violations nothing is dispatched: the run is failed, or in
+        autofix mode the offending tasks are sent to auto-fix and the run is
+        held until `apply_patch_and_retry` clears them.
+        """
+        if self._preflight == "off":
+            return True
+        tasks = dag.get("tasks", [])
+        try:
+            validate_dag(tasks)
+        except (DagError, KeyError) as e:
+            await self._fail_run(run_id, f"Invalid DAG: {e}")
+            return False
+        decisions = self._policy.evaluate_dag(tasks, self._run_context(tasks))
+        for task_id, decision in decisions.items():
+            for warning in decision["warn"]:
+                logger.warning("Run %s task %s: %s", run_id, task_id, warning)
+        violations = {task_id: d["deny"] for task_id, d in decisions.items() if d["deny"]}
+        if not violations:
+            return True
+
+        logger.info("Run %s failed compliance preflight: %s", run_id, violations)
+        for task in tasks:
+            await self._tracer.create_task_node(run_id, task["id"], task)
+        self._runs.create_tasks(run_id, tasks)
+
+        if self._preflight == "fail":
+            await self._fail_preflight(run_id, tasks, violations)
+            return False
+
+        # Held tasks stay pending, so the run cannot complete while auto-fix works
+        self._held[run_id] = {
+            "dag": dag,
+            "violations": violations,
+            "attempts": {task_id: 1 for task_id in violations},
+        }
+        self._arm_held_deadline(run_id)
+        tasks_by_id = {task["id"]: task for task in tasks}
+        await self.publish_many(
+            self._autofix_message(run_id, tasks_by_id[task_id], task_violations)
+            for task_id, task_violations in violations.items()
+        )
+        return False
+
+    def _autofix_message(self, run_id: str, task: dict, violations) -> Tuple[str, dict, str]:
+        payload = {
+            "runId": run_id,
+            "taskId": task["id"],
+            "output": {"stage": "preflight", "violations": violations, "task": task}
+        }
+        return "workflow.autofix.request", payload, ""
+
+    def _arm_held_deadline(self, run_id: str):
+        """
+        (Re)start the wait for auto-fix on a held run; called whenever an
+        auto-fix request is sent for it.
+        """
+        held = self._held[run_id]
+        if held.get("deadline"):
+            held["deadline"].cancel()
+        if self._autofix_timeout:
+            held["deadline"] = asyncio.create_task(self._expire_held(run_id, held))
+
+    async def _expire_held(self, run_id: str, held: dict):
+        await asyncio.sleep(self._autofix_timeout)
+        if self._held.get(run_id) is not held:
+            return
+        del self._held[run_id]
+        logger.warning(
+            "Run %s: no auto-fix reply within %ss, failing compliance preflight",
+            run_id, self._autofix_timeout
+        )
+        await self._fail_preflight(run_id, held["dag"].get("tasks", []), held["violations"])
+
+    def _unhold(self, run_id: str) -> dict:
+        held = self._held.pop(run_id)
+        if held.get("deadline"):
+            held["deadline"].cancel()
+        return held
+
+    async def _fail_preflight(self, run_id: str, tasks, violations: dict):
+        """
+        Fail the violating tasks and skip the rest, which completes the run as failed.
+        """
+        self._forget_run(run_id)
+        for task in tasks:
+            if task["id"] in violations:
+                await self._tracer.record_task_result(
+                    run_id, task["id"], "fail", {"stage": "preflight", "violations": violations[task["id"]]}
+                )
+                self._runs.record_result(run_id, task["id"], "fail")
+            else:
+                await self._tracer.record_task_result(
+                    run_id, task["id"], "skipped", {"reason": "compliance preflight failed"}
+                )
+                self._runs.record_result(run_id, task["id"], "skipped")
+
+    async def _resolve_held(self, run_id: str, task_id: str, updates: dict):
+        """
+        Apply an auto-fix patch to a run held by the preflight and re-check the
+        patched task. Dispatches the run once no violations remain, and fails
+        it when a task is still violating after `max_fix_attempts`, or when
+        no auto-fix reply arrives within `autofix_timeout` seconds.
+        """
+        held = self._held[run_id]
+        tasks = held["dag"].get("tasks", [])
+        for task in tasks:
+            if task["id"] == task_id:
+                task.update(updates)
+                patched = task
+                break
+        else:
+            logger.warning("Auto-fix patch for unknown task %s of run %s", task_id, run_id)
+            return
+
+        decision = self._policy.evaluate_dag([patched], self._run_context(tasks))[task_id]
+        if not decision["deny"]:
+            held["violations"].pop(task_id, None)
+        elif held["attempts"].get(task_id, 0) >= self._max_fix_attempts:
+            self._unhold(run_id)
+            held["violations"][task_id] = decision["deny"]
+            await self._fail_preflight(run_id, tasks, held["violations"])
+            return
+        else:
+            held["violations"][task_id] = decision["deny"]
+            held["attempts"][task_id] = held["attempts"].get(task_id, 0) + 1
+            self._arm_held_deadline(run_id)
+            await self.publish_many([self._autofix_message(run_id, patched, decision["deny"])])
+            return
+
+        if not held["violations"]:
+            self._unhold(run_id)
+            await self.dispatch_tasks(run_id, held["dag"])
+
     async def dispatch_tasks(self, run_id: str, dag: dict):
         """
-        Given a DAG from planner, create task nodes and publish each to its agent.
+        Given a DAG from planner, create task nodes and release the tasks whose
+        `needs:` are satisfied. The rest are published by `handle_task_result`
+        as their predecessors pass.
         """
-        for task in dag.get("tasks", []):
-            task_id = task["id"]
-            self._tracer.create_task_node(run_id, task_id, task)
+        tasks = dag.get("tasks", [])
+        try:
+            scheduler = DagScheduler(
+                tasks,
+                max_in_flight=self._max_in_flight,
+                default_max_in_flight=self._default_max_in_flight
+            )
+        except (DagError, KeyError) as e:
+            await self._fail_run(run_id, f"Invalid DAG: {e}")
+            return
+        for task in tasks:
+            await self._tracer.create_task_node(run_id, task["id"], task)
+        self._runs.create_tasks(run_id, tasks)
 
-            subject = f"task.{task['type']}.request"
-            task_payload = {
-                "runId": run_id,
-                "taskId": task_id,
-                "payload": task
-            }
-            await self.publish(subject, task_payload)
+        self._schedulers[run_id] = scheduler
+        await self._release(run_id)
+
+    async def _fail_run(self, run_id: str, reason: str):
+        """
+        Fail a run that cannot be dispatched, e.g. because its planned DAG
+        is invalid.
+        """
+        logger.error("Run %s failed: %s", run_id, reason)
+        self._forget_run(run_id)
+        await self._tracer.fail_run(run_id, reason)
+        self._runs.fail_run(run_id)
+
+    def _touch(self, run_id: str) -> float:
+        """
+        Record activity on a run, sweeping idle runs' state now and then.
+        """
+        now = time.monotonic()
+        self._last_activity[run_id] = now
+        if self._state_ttl and now - self._last_sweep > min(self._state_ttl, 60):
+            self._last_sweep = now
+            for idle in [r for r, seen in self._last_activity.items() if now - seen > self._state_ttl]:
+                logger.warning("Dropping state of run %s: no activity for %ss", idle, self._state_ttl)
+                self._forget_run(idle)
+                self._runs.forget(idle)
+        return now
+
+    def _forget_run(self, run_id: str):
+        """
+        Drop the in-memory scheduling and metrics state of a run.
+        """
+        self._schedulers.pop(run_id, None)
+        self._plan_started.pop(run_id, None)
+        self._dispatched.pop(run_id, None)
+        self._last_activity.pop(run_id, None)
+
+    async def handle_task_result(self, run_id: str, task_id: str, status: str, output):
+        """
+        Persist an agent's result and publish any tasks it unblocked.
+        """
+        dispatched = self._dispatched.get(run_id, {}).pop(task_id, None)
+        if dispatched is not None:
+            TASK_EXECUTION.observe(self._touch(run_id) - dispatched[1], dispatched[0], str(status))
+        await self._tracer.record_task_result(run_id, task_id, status, output)
+        self._runs.record_result(run_id, task_id, status)
+
+        scheduler = self._schedulers.get(run_id)
+        if scheduler is None or not scheduler.complete(task_id, status):
+            return
+        await self._release(run_id)
+
+    async def _release(self, run_id: str):
+        scheduler = self._schedulers[run_id]
+        released = scheduler.release()
+        now = self._touch(run_id)
+        dispatched = self._dispatched.setdefault(run_id, {})
+        for task in released:
+            task_type = task.get("type", "")
+            TASK_QUEUE_WAIT.observe(now - scheduler.ready_at.pop(task["id"], now), task_type)
+            dispatched[task["id"]] = (task_type, now)
+        if released:
+            released_ids = [task["id"] for task in released]
+            await self._tracer.mark_tasks_running(run_id, released_ids)
+            self._runs.mark_running(run_id, released_ids)
+        await self.publish_many(self._task_message(run_id, task) for task in released)
+        if scheduler.finished and self._schedulers.get(run_id) is scheduler:
+            self._forget_run(run_id)
+            # Tasks stuck behind a failure will never run; close them out so
+            # the run's pending counter drains and the run completes.
+            for task_id in scheduler.blocked():
+                await self._tracer.record_task_result(
+                    run_id, task_id, "skipped", {"reason": "upstream task failed"}
+                )
+                self._runs.record_result(run_id, task_id, "skipped")
 
     async def apply_patch_and_retry(self, run_id: str, patch: dict):
         """
         Apply auto-fix patch for a failed task, update DAG in tracer,
-        then re-dispatch the corrected task(s).
+        then re-dispatch only the patched task and its downstream dependents.
+        Tasks outside that set keep their recorded results, so passed
+        predecessors are not re-run.
         """
         task_id = patch.get("taskId")
         updates = patch.get("patch", {})
 
-        self._tracer.record_patch(run_id, task_id, updates)
-        corrected_tasks = self._tracer.apply_patch(run_id, task_id, updates)
-
-        for task in corrected_tasks:
-            subject = f"task.{task['type']}.request"
-            retry_payload = {
-                "runId": run_id,
-                "taskId": task["id"],
-                "payload": task
-            }
-            await self.publish(subject, retry_payload)
+        await self._tracer.record_patch(run_id, task_id, updates)
+        retry_tasks = await self._tracer.apply_patch(run_id, task_id, updates)
+        if run_id in self._held:
+            await self._resolve_held(run_id, task_id, updates)
+            return
+        if not retry_tasks:
+            logger.warning("Auto-fix patch for unknown task %s of run %s", task_id, run_id)
+            return
+        self._runs.reset_tasks(run_id, [task["id"] for task in retry_tasks])
+
+        scheduler = self._schedulers.get(run_id)
+        if scheduler is not None:
+            scheduler.reset(retry_tasks)
+        else:
+            # The run had finished (or was dispatched by another replica):
+            # rebuild its scheduler from the recorded task statuses
+            stored = await self._tracer.get_run_tasks(run_id)
+            self._schedulers[run_id] = DagScheduler(
+                [task for task, _ in stored],
+                max_in_flight=self._max_in_flight,
+                default_max_in_flight=self._default_max_in_flight,
+                statuses={task["id"]: status for task, status in stored}
+            )
+        logger.info(
+            "Retrying %d task(s) of run %s after patch to %s",
+            len(retry_tasks), run_id, task_id
+        )
+        await self._release(run_id)
@@ -0,0 +1,91 @@
+# orchestrator/codec.py
+
+import json
+import zlib
+from typing import Any
+
+import yaml
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for format="msgpack"
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # optional: faster wire encoding, stdlib json otherwise
+    orjson = None
+
+
+# Wire codec for NATS messages. Agents speak JSON, so the wire format stays
+# JSON; orjson is used when installed.
+if orjson is not None:
+    def encode_message(payload: Any) -> bytes:
+        return orjson.dumps(payload, default=str)
+
+    def decode_message(data: bytes) -> Any:
+        return orjson.loads(data)
+else:
+    def encode_message(payload: Any) -> bytes:
+        return json.dumps(payload, separators=(",", ":"), default=str).encode()
+
+    def decode_message(data: bytes) -> Any:
+        return json.loads(data)
+
+
+class StorageCodec:
+    """
+    Encodes structured values (specs, task payloads, outputs, patch updates)
+    for storage as Neo4j byte-array properties.
+
+    Every encoded value starts with a one-byte tag naming its format, so the
+    codec can change without rewriting old nodes:
+
+      J / M  compact JSON / msgpack
+      j / m  the same, zlib-compressed (used above `compress_threshold` bytes)
+
+    Plain strings are the legacy `yaml.safe_dump` encoding and are still
+    decoded, which lets existing graphs be read before they are migrated.
+    """
+
+    JSON = b"J"
+    JSON_ZLIB = b"j"
+    MSGPACK = b"M"
+    MSGPACK_ZLIB = b"m"
+
+    def __init__(self, format: str = "json", compress_threshold: int = 4096, compress_level: int = 6):
+        if format not in ("json", "msgpack"):
+            raise ValueError(f"Unknown storage format '{format}'")
+        if format == "msgpack" and msgpack is None:
+            raise ValueError("storage format 'msgpack' requires the msgpack package")
+        self.format = format
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, value: Any) -> bytes:
+        if self.format == "msgpack":
+            tag, zlib_tag = self.MSGPACK, self.MSGPACK_ZLIB
+            body = msgpack.packb(value, use_bin_type=True, default=str)
+        else:
+            tag, zlib_tag = self.JSON, self.JSON_ZLIB
+            body = json.dumps(value, separators=(",", ":"), default=str).encode()
+        if self.compress_threshold and len(body) > self.compress_threshold:
+            return zlib_tag + zlib.compress(body, self.compress_level)
+        return tag + body
+
+    def decode(self, value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return yaml.safe_load(value)
+        value = bytes(value)
+        tag, body = value[:1], value[1:]
+        if tag in (self.JSON_ZLIB, self.MSGPACK_ZLIB):
+            body = zlib.decompress(body)
+        if tag in (self.JSON, self.JSON_ZLIB):
+            return json.loads(body)
+        if tag in (self.MSGPACK, self.MSGPACK_ZLIB):
+            if msgpack is None:
+                raise ValueError("Stored value is msgpack-encoded but msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+        raise ValueError(f"Unknown storage encoding tag {tag!r}")
@@ -0,0 +1,156 @@
+# orchestrator/compliance.py
+
+import re
+import json
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Stands in for an undefined Rego reference: a rule body that reads one
+# does not match.
+_UNDEFINED = object()
+
+
+def _lookup(doc: Any, *path: str) -> Any:
+    for key in path:
+        if not isinstance(doc, dict) or key not in doc:
+            return _UNDEFINED
+        doc = doc[key]
+    return doc
+
+
+def _truthy(value: Any) -> bool:
+    # Rego `not x` holds when x is undefined or false
+    return value is not _UNDEFINED and value is not False
+
+
+_SEMVER = re.compile(r"^v?[0-9]+\.[0-9]+\.[0-9]+$")
+
+
+def _helm_namespace(doc: Dict[str, Any]) -> Optional[str]:
+    namespace = _lookup(doc, "task", "payload", "namespace")
+    if namespace is _UNDEFINED or namespace == "staging":
+        return None
+    return f"Helm upgrade must deploy to 'staging', not '{namespace}'."
+
+
+def _helm_image_tag(doc: Dict[str, Any]) -> Optional[str]:
+    tag = _lookup(doc, "task", "payload", "image_tag")
+    # fullmatch: Python's `$` would also match before a trailing newline, Go's does not
+    if tag is _UNDEFINED or (isinstance(tag, str) and _SEMVER.fullmatch(tag)):
+        return None
+    return f"Image tag '{tag}' is not a valid semver (e.g. '1.2.3')."
+
+
+def _build_context(doc: Dict[str, Any]) -> Optional[str]:
+    context = _lookup(doc, "task", "payload", "context")
+    if context is _UNDEFINED or (isinstance(context, str) and context.startswith("./services/")):
+        return None
+    return f"Docker build context '{context}' must be under './services/'."
+
+
+def _doc_template(doc: Dict[str, Any]) -> Optional[str]:
+    if _truthy(_lookup(doc, "task", "payload", "template")):
+        return None
+    return "llm-doc task missing 'template' parameter."
+
+
+def _build_concurrency(doc: Dict[str, Any]) -> Optional[str]:
+    concurrency = _lookup(doc, "run", "concurrency")
+    if not isinstance(concurrency, (int, float)) or isinstance(concurrency, bool) or concurrency <= 5:
+        return None
+    return f"High build concurrency ({concurrency}) may overwhelm registry."
+
+
+# In-process port of policies/compliance/policy.rego, rule for rule:
+# (decision, task type, check returning a message or None).
+# Keep it in step with the .rego file.
+COMPLIANCE_RULES = [
+    ("deny", "helm-upgrade", _helm_namespace),
+    ("deny", "helm-upgrade", _helm_image_tag),
+    ("deny", "docker-build", _build_context),
+    ("deny", "llm-doc", _doc_template),
+    ("warn", "docker-build", _build_concurrency),
+]
+
+
+def input_digest(doc: Any) -> str:
+    """
+    SHA-256 over the canonical JSON form of a policy input, so equal inputs
+    hash equally regardless of key order.
+    """
+    blob = json.dumps(doc, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class PolicyEngine:
+    """
+    Evaluates policy inputs (`{"task": {"type", "payload"}, "run": {...}}`)
+    against in-process compliance rules and returns `{"deny": [...],
+    "warn": [...]}`, the same decision OPA gives for the compliance package.
+
+    Decisions are cached in an LRU keyed by `input_digest`, so repeated
+    identical inputs skip evaluation. `remember` lets callers that evaluate
+    elsewhere (e.g. a remote OPA) share the cache. Cached decisions are
+    shared, so callers must not mutate them.
+    """
+
+    def __init__(self, rules: Optional[List[tuple]] = None, max_entries: int = 4096):
+        self._rules: Dict[str, List[tuple]] = {}
+        for decision, task_type, check in COMPLIANCE_RULES if rules is None else rules:
+            self._rules.setdefault(task_type, []).append((decision, check))
+        self._max_entries = max_entries
+        self._decisions: "OrderedDict[str, Dict[str, List[str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, doc: Dict[str, Any], key: Optional[str] = None) -> Optional[Dict[str, List[str]]]:
+        key = key or input_digest(doc)
+        decision = self._decisions.get(key)
+        if decision is None:
+            self.misses += 1
+            return None
+        self._decisions.move_to_end(key)
+        self.hits += 1
+        return decision
+
+    def remember(self, doc: Dict[str, Any], decision: Dict[str, List[str]], key: Optional[str] = None):
+        self._decisions[key or input_digest(doc)] = decision
+        while len(self._decisions) > self._max_entries:
+            self._decisions.popitem(last=False)
+
+    def evaluate(self, doc: Dict[str, Any]) -> Dict[str, List[str]]:
+        key = input_digest(doc)
+        decision = self.cached(doc, key)
+        if decision is not None:
+            return decision
+        decision = {"deny": [], "warn": []}
+        task_type = _lookup(doc, "task", "type")
+        for kind, check in self._rules.get(task_type, ()) if isinstance(task_type, str) else ():
+            message = check(doc)
+            if message is not None:
+                decision[kind].append(message)
+        self.remember(doc, decision, key)
+        return decision
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._decisions)}
+
+    def evaluate_dag(
+        self,
+        tasks: List[Dict[str, Any]],
+        run_context: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Evaluate every task of a planned DAG in one pass. Each task is checked
+        as `{"task": {"type", "payload": task}, "run": run_context(task)}`,
+        the input the compliance agent sees. Returns {task_id: decision}.
+        """
+        return {
+            task["id"]: self.evaluate({
+                "task": {"type": task.get("type"), "payload": task},
+                "run": run_context(task) if run_context else {},
+            })
+            for task in tasks
+        }
@@ -1,70 +1,530 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import os
-import yaml
+import logging
+import threading
 from neo4j import GraphDatabase, BoltDriver
 
+from orchestrator.codec import StorageCodec
+from orchestrator.scheduler import downstream
+
+logger = logging.getLogger("orchestrator.graph_tracer")
+
+# Every write bumps w.version so in-process spec caches can tell stale
+# entries apart; schedule is kept as a native property for listings.
+MERGE_WORKFLOW_CYPHER = """
+MERGE (w:Workflow {id: $workflow_id})
+SET w.spec = $spec, w.name = $workflow_id, w.schedule = $schedule,
+    w.version = coalesce(w.version, 0) + 1
+RETURN w.version AS version
+"""
+
+# Only workflows written before schedule became a property need their spec parsed.
+LIST_WORKFLOWS_CYPHER = """
+MATCH (w:Workflow)
+RETURN w.id AS workflowId, w.name AS name, w.schedule AS schedule,
+       CASE WHEN w.schedule IS NULL THEN w.spec END AS spec
+"""
+
+GET_WORKFLOW_SPEC_CYPHER = """
+MATCH (w:Workflow {id: $workflow_id})
+RETURN w.spec AS spec, coalesce(w.version, 0) AS version
+"""
+
+GET_WORKFLOW_VERSION_CYPHER = """
+MATCH (w:Workflow {id: $workflow_id})
+RETURN coalesce(w.version, 0) AS version
+"""
+
+CREATE_RUN_CYPHER = """
+MATCH (w:Workflow {id: $workflow_id})
+MERGE (r:Run {id: $run_id})
+SET r.startedAt = datetime(), r.status = 'running', r.workflowId = $workflow_id,
+    r.spec = $spec, r.overrides = $overrides,
+    r.pending = 0, r.running = 0, r.passed = 0, r.failed = 0
+MERGE (w)-[:HAS_RUN]->(r)
+"""
+
+RUN_STATUS_CYPHER = """
+MATCH (r:Run {id: $run_id})
+OPTIONAL MATCH (r)-[:EXECUTED]->(t:Task)
+RETURN r.id AS runId, r.status AS status,
+       r.startedAt AS startedAt, r.completedAt AS completedAt,
+       r {.pending, .running, .passed, .failed} AS counts,
+       collect({
+         taskId: t.id,
+         type: t.type,
+         status: t.status,
+         startedAt: t.startedAt,
+         completedAt: t.completedAt
+       }) AS tasks
+"""
+
+# Fails a run that cannot proceed at all (e.g. an invalid planned DAG)
+FAIL_RUN_CYPHER = """
+MATCH (r:Run {id: $run_id})
+WHERE r.status = 'running'
+SET r.status = 'failed', r.completedAt = datetime(), r.error = $reason
+"""
+
+GET_RUN_SPEC_CYPHER = """
+MATCH (r:Run {id: $run_id})
+RETURN r.spec AS spec
+"""
+
+SET_RUN_SPEC_CYPHER = """
+MATCH (r:Run {id: $run_id})
+SET r.spec = $spec
+"""
+
+# Per-run task counters kept on the Run node. A task in any status other
+# than pending/running/pass counts as failed, matching the old rule that a
+# run succeeds only if every task passed.
+RUN_COUNTERS = (
+    ("pending", "{s} = 'pending'"),
+    ("running", "{s} = 'running'"),
+    ("passed", "{s} = 'pass'"),
+    ("failed", "NOT {s} IN ['pending', 'running', 'pass']"),
+)
+
+
+def counter_transition(prev: str, new: str) -> str:
+    """
+    Build a SET fragment moving one task from status `prev` to `new` in the
+    Run node's counters. A null `prev` (newly created task) decrements nothing.
+    """
+    return ",\n    ".join(
+        f"r.{counter} = coalesce(r.{counter}, 0)"
+        f" + CASE WHEN {pred.format(s=new)} THEN 1 ELSE 0 END"
+        f" - CASE WHEN {pred.format(s=prev)} THEN 1 ELSE 0 END"
+        for counter, pred in RUN_COUNTERS
+    )
+
+
+# Bulk statements used by the write-behind buffer. Each takes a list of
+# row maps and applies it with a single UNWIND. Writing r.updatedAt first
+# takes the Run node's write lock, so concurrent transactions for the same
+# run apply their counter updates one after another.
+CREATE_TASKS_CYPHER = f"""
+UNWIND $rows AS row
+MATCH (r:Run {{id: row.run_id}})
+SET r.updatedAt = datetime()
+MERGE (r)-[:EXECUTED]->(t:Task {{id: row.task_id}})
+WITH r, t, row, t.status AS prev
+SET t.type = row.type, t.needs = row.needs, t.payload = row.payload,
+    t.status = 'pending',
+    {counter_transition("prev", "'pending'")}
+"""
+
+MARK_RUNNING_CYPHER = f"""
+UNWIND $rows AS row
+MATCH (t:Task {{id: row.task_id}})<-[:EXECUTED]-(r:Run {{id: row.run_id}})
+SET r.updatedAt = datetime()
+WITH r, t, t.status AS prev
+WHERE prev = 'pending'
+SET t.status = 'running', t.startedAt = datetime(),
+    {counter_transition("prev", "'running'")}
+"""
+
+# Completion is decided from the counters in the same statement, so it is
+# constant time per result; the status guard makes the transition to
+# success/failed happen exactly once.
+RECORD_RESULTS_CYPHER = f"""
+UNWIND $rows AS row
+MATCH (t:Task {{id: row.task_id}})<-[:EXECUTED]-(r:Run {{id: row.run_id}})
+SET r.updatedAt = datetime()
+WITH r, t, row, t.status AS prev
+SET t.status = row.status,
+    t.output = row.output,
+    t.completedAt = datetime(),
+    {counter_transition("prev", "row.status")}
+WITH r
+WHERE r.status = 'running' AND r.pending = 0 AND r.running = 0
+SET r.status = CASE WHEN r.failed = 0 THEN 'success' ELSE 'failed' END,
+    r.completedAt = datetime()
+RETURN r.id AS runId, r.status AS status
+"""
+
+# Ordered so a scheduler rebuilt from these rows breaks priority ties the
+# same way every time
+GET_RUN_TASKS_CYPHER = """
+MATCH (r:Run {id: $run_id})-[:EXECUTED]->(t:Task)
+RETURN t.id AS taskId, t.payload AS payload, t.status AS status
+ORDER BY t.id
+"""
+
+# Sends tasks back to pending for a retry and reopens the run if it had
+# already completed.
+RESET_TASKS_CYPHER = f"""
+UNWIND $rows AS row
+MATCH (t:Task {{id: row.task_id}})<-[:EXECUTED]-(r:Run {{id: row.run_id}})
+SET r.updatedAt = datetime(), r.status = 'running', r.completedAt = null
+WITH r, t, row, t.status AS prev
+SET t.payload = row.payload, t.needs = row.needs, t.status = 'pending',
+    t.output = null, t.startedAt = null, t.completedAt = null,
+    {counter_transition("prev", "'pending'")}
+"""
+
+RECORD_PATCHES_CYPHER = """
+UNWIND $rows AS row
+MATCH (t:Task {id: row.task_id})<-[:EXECUTED]-(r:Run {id: row.run_id})
+MERGE (p:Patch {id: randomUUID()})
+SET p.timestamp = datetime(), p.updates = row.updates
+MERGE (r)-[:HAS_PATCH]->(p)
+MERGE (p)-[:PATCH_OF]->(t)
+"""
+
+
+# Properties holding codec-encoded values. Nodes written before the storage
+# codec existed hold YAML strings here; see GraphTracer.migrate_legacy_encoding.
+ENCODED_PROPERTIES = (
+    ("Workflow", "spec"),
+    ("Run", "spec"),
+    ("Run", "overrides"),
+    ("Task", "payload"),
+    ("Task", "output"),
+    ("Patch", "updates"),
+)
+
+BACKFILL_RUN_WORKFLOW_ID_CYPHER = """
+MATCH (w:Workflow)-[:HAS_RUN]->(r:Run)
+WHERE r.workflowId IS NULL
+SET r.workflowId = w.id
+"""
+
+def _count(statuses: str, counter: str) -> str:
+    pred = dict(RUN_COUNTERS)[counter]
+    return f"size([s IN {statuses} WHERE {pred.format(s='s')}])"
+
+
+def counter_backfill(statuses: str) -> str:
+    """
+    Build a SET fragment recounting a Run node's counters from `statuses`,
+    a list of its tasks' statuses.
+    """
+    return ",\n    ".join(f"r.{counter} = {_count(statuses, counter)}" for counter, _ in RUN_COUNTERS)
+
+
+# Runs created before the counters existed have null counters. Transitions
+# would count them up from zero, so an in-flight run could never drain to
+# completion; recount them from their tasks instead, and complete runs whose
+# tasks have all finished, batch by batch.
+BACKFILL_RUN_COUNTERS_CYPHER = f"""
+MATCH (r:Run)
+WHERE r.pending IS NULL OR r.running IS NULL OR r.passed IS NULL OR r.failed IS NULL
+WITH r LIMIT $limit
+OPTIONAL MATCH (r)-[:EXECUTED]->(t:Task)
+WITH r, collect(t.status) AS statuses
+WITH r, statuses,
+     r.status = 'running' AND size(statuses) > 0
+     AND {_count("statuses", "pending")} = 0 AND {_count("statuses", "running")} = 0 AS done
+SET {counter_backfill("statuses")},
+    r.status = CASE WHEN NOT done THEN r.status
+                    WHEN {_count("statuses", "failed")} = 0 THEN 'success'
+                    ELSE 'failed' END,
+    r.completedAt = CASE WHEN done THEN coalesce(r.completedAt, datetime()) ELSE r.completedAt END
+RETURN count(r) AS backfilled
+"""
+
+
+def legacy_select_cypher(label: str, prop: str) -> str:
+    return (
+        f"MATCH (n:{label}) WHERE n.{prop} IS :: STRING NOT NULL "
+        f"RETURN elementId(n) AS id, n.{prop} AS value LIMIT $limit"
+    )
+
+
+def reencode_cypher(label: str, prop: str) -> str:
+    return (
+        f"UNWIND $rows AS row MATCH (n:{label}) WHERE elementId(n) = row.id "
+        f"SET n.{prop} = row.value, n += row.native"
+    )
+
+
+def reencode_row(codec: StorageCodec, label: str, prop: str, rec) -> Dict[str, Any]:
+    """
+    Decode a legacy YAML property and re-encode it, promoting the fields that
+    newer writers keep as native properties.
+    """
+    value = codec.decode(rec["value"])
+    native = {}
+    if (label, prop) == ("Workflow", "spec"):
+        native["schedule"] = (value or {}).get("schedule", "")
+    elif (label, prop) == ("Task", "payload"):
+        needs = (value or {}).get("needs") or []
+        native["needs"] = [needs] if isinstance(needs, str) else list(needs)
+    return {"id": rec["id"], "value": codec.encode(value), "native": native}
+
+
+def workflow_listing(codec: StorageCodec, rec) -> Dict[str, str]:
+    schedule = rec["schedule"]
+    if schedule is None:
+        schedule = (codec.decode(rec["spec"]) or {}).get("schedule", "")
+    return {
+        "workflowId": rec["workflowId"],
+        "name": rec["name"],
+        "schedule": schedule
+    }
+
+
+def _iso(value):
+    # neo4j.time.DateTime -> ISO 8601 string, the form RunStateStore uses
+    return value.iso_format() if hasattr(value, "iso_format") else value
+
+
+def run_status(rec) -> Dict[str, Any]:
+    return {
+        "runId": rec["runId"],
+        "status": rec["status"],
+        "startedAt": _iso(rec["startedAt"]),
+        "completedAt": _iso(rec["completedAt"]),
+        "counts": rec["counts"],
+        "tasks": [
+            dict(task, startedAt=_iso(task.get("startedAt")), completedAt=_iso(task.get("completedAt")))
+            for task in rec["tasks"]
+        ]
+    }
+
+
+def patch_spec(codec: StorageCodec, stored_spec: Any, task_id: str, updates: Dict[str, Any]):
+    """
+    Apply `updates` to the task `task_id` of a stored run spec.
+    Returns the updated spec and its re-encoded form.
+    """
+    spec = codec.decode(stored_spec)
+    # Find and update the specific task in spec
+    for task in spec.get("tasks", []):
+        if task["id"] == task_id:
+            task.update(updates)
+    return spec, codec.encode(spec)
+
+
+def run_tasks(codec: StorageCodec, recs) -> List[Tuple[Dict[str, Any], str]]:
+    return [(codec.decode(rec["payload"]), rec["status"]) for rec in recs]
+
+
+def retry_rows(
+    codec: StorageCodec, run_id: str, tasks: List[Dict[str, Any]], task_id: str, updates: Dict[str, Any]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Apply `updates` to task `task_id` among a run's stored tasks and select
+    what a retry has to re-run: the patched task and its transitive
+    dependents. Returns (rows for RESET_TASKS_CYPHER, those tasks).
+    """
+    for task in tasks:
+        if task["id"] == task_id:
+            task.update(updates)
+    affected = set(downstream(tasks, [task_id]))
+    retry = [task for task in tasks if task["id"] in affected]
+    rows = []
+    for task in retry:
+        row = task_row(codec, run_id, task["id"], task)
+        rows.append({k: row[k] for k in ("run_id", "task_id", "needs", "payload")})
+    return rows, retry
+
+
+def task_row(codec: StorageCodec, run_id: str, task_id: str, task_payload: Dict[str, Any]) -> Dict[str, Any]:
+    needs = task_payload.get("needs") or []
+    return {
+        "run_id": run_id,
+        "task_id": task_id,
+        "type": task_payload.get("type", ""),
+        "needs": [needs] if isinstance(needs, str) else list(needs),
+        "payload": codec.encode(task_payload),
+    }
+
+
+def result_row(codec: StorageCodec, run_id: str, task_id: str, status: str, output: Any) -> Dict[str, Any]:
+    return {
+        "run_id": run_id,
+        "task_id": task_id,
+        "status": status,
+        "output": codec.encode(output),
+    }
+
+
+def patch_row(codec: StorageCodec, run_id: str, task_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "run_id": run_id,
+        "task_id": task_id,
+        "updates": codec.encode(updates),
+    }
+
+
+class WriteBuffer:
+    """
+    Pending write-behind rows, grouped by statement in flush order:
+    task creations, running marks, then results, then patches.
+    """
+
+    def __init__(self):
+        self.tasks: List[Dict[str, Any]] = []
+        self.running: List[Dict[str, Any]] = []
+        self.results: List[Dict[str, Any]] = []
+        self.patches: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.tasks) + len(self.running) + len(self.results) + len(self.patches)
+
+    def prepend(self, other: "WriteBuffer"):
+        """
+        Put rows from a failed flush back in front of anything queued since.
+        """
+        self.tasks[:0] = other.tasks
+        self.running[:0] = other.running
+        self.results[:0] = other.results
+        self.patches[:0] = other.patches
+
+    def statements(self, batch_size: int):
+        """
+        Yield (cypher, params) pairs in dependency order, chunking each
+        statement's rows into at most `batch_size` per UNWIND.
+        """
+        for cypher, rows in (
+            (CREATE_TASKS_CYPHER, self.tasks),
+            (MARK_RUNNING_CYPHER, self.running),
+            (RECORD_RESULTS_CYPHER, self.results),
+            (RECORD_PATCHES_CYPHER, self.patches),
+        ):
+            for i in range(0, len(rows), batch_size):
+                yield cypher, {"rows": rows[i:i + batch_size]}
+
+
 class GraphTracer:
     """
     Persists workflows, runs, tasks, and patches in Neo4j for provenance and audit.
+
+    With `buffered=True`, task creations, task results and patch records are
+    queued and written behind in bulk: a flush happens once `batch_size` rows
+    are pending or `flush_interval` seconds after the first queued row, and
+    always before reads that depend on them (`get_run_status`, `apply_patch`).
     """
 
-    def __init__(self, uri: str, user: str, pwd: str):
-        self._driver: BoltDriver = GraphDatabase.driver(uri, auth=(user, pwd))
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        pwd: str,
+        buffered: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_connection_pool_size: int = 100,
+        max_connection_lifetime: float = 3600,
+        codec: Optional[StorageCodec] = None,
+    ):
+        self._codec = codec or StorageCodec()
+        self._driver: BoltDriver = GraphDatabase.driver(
+            uri,
+            auth=(user, pwd),
+            max_connection_pool_size=max_connection_pool_size,
+            max_connection_lifetime=max_connection_lifetime,
+        )
+        self._buffered = buffered
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer = WriteBuffer()
+        self._buffer_lock = threading.Lock()
+        # Serializes flushes so batches commit in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
 
     def close(self):
+        self.flush()
         self._driver.close()
 
-    def create_workflow_node(self, workflow_id: str, spec: Dict[str, Any]):
+    def _enqueue(self, kind: str, row: Dict[str, Any]):
+        with self._buffer_lock:
+            getattr(self._buffer, kind).append(row)
+            pending = len(self._buffer)
+            if self._timer is None and pending < self._batch_size:
+                self._timer = threading.Timer(self._flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if pending >= self._batch_size:
+            self.flush()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Write-behind flush failed, will retry: %s", e)
+            with self._buffer_lock:
+                if self._timer is None:
+                    self._timer = threading.Timer(self._flush_interval, self._flush_on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def flush(self):
+        """
+        Write all buffered rows to Neo4j in a single transaction. On failure the
+        rows are put back in the buffer and the error is re-raised.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batch, self._buffer = self._buffer, WriteBuffer()
+            if not len(batch):
+                return
+            try:
+                with self._driver.session() as ses:
+                    ses.execute_write(self._write_batch, batch)
+            except Exception:
+                with self._buffer_lock:
+                    self._buffer.prepend(batch)
+                raise
+
+    def _write_batch(self, tx, batch: WriteBuffer):
+        for cypher, params in batch.statements(self._batch_size):
+            for rec in tx.run(cypher, **params):
+                logger.info("Run %s completed with status %s", rec["runId"], rec["status"])
+
+    def create_workflow_node(self, workflow_id: str, spec: Dict[str, Any]) -> int:
         """
-        Create or update a Workflow node with its YAML spec.
+        Create or update a Workflow node with its encoded spec.
+        Returns the Workflow's new version.
         """
-        spec_yaml = yaml.safe_dump(spec)
         with self._driver.session() as ses:
-            ses.run(
-                """
-                MERGE (w:Workflow {id: $workflow_id})
-                SET w.spec = $spec_yaml, w.name = $workflow_id
-                """,
+            rec = ses.run(
+                MERGE_WORKFLOW_CYPHER,
                 workflow_id=workflow_id,
-                spec_yaml=spec_yaml
-            )
+                spec=self._codec.encode(spec),
+                schedule=spec.get("schedule", "")
+            ).single()
+            return rec["version"]
 
     def list_workflows(self) -> List[Dict[str, str]]:
         """
         Return list of workflows with id, name, and schedule.
         """
         with self._driver.session() as ses:
-            result = ses.run(
-                """
-                MATCH (w:Workflow)
-                RETURN w.id AS workflowId, w.name AS name, w.spec AS spec_yaml
-                """
-            )
-            out = []
-            for rec in result:
-                spec = yaml.safe_load(rec["spec_yaml"])
-                out.append({
-                    "workflowId": rec["workflowId"],
-                    "name": rec["name"],
-                    "schedule": spec.get("schedule", "")
-                })
-            return out
+            result = ses.run(LIST_WORKFLOWS_CYPHER)
+            return [workflow_listing(self._codec, rec) for rec in result]
 
-    def get_workflow_spec(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+    def get_workflow(self, workflow_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
         """
-        Retrieve the full YAML spec for given workflow.
+        Retrieve the version and full spec for given workflow.
         """
         with self._driver.session() as ses:
-            rec = ses.run(
-                """
-                MATCH (w:Workflow {id: $workflow_id})
-                RETURN w.spec AS spec_yaml
-                """,
-                workflow_id=workflow_id
-            ).single()
+            rec = ses.run(GET_WORKFLOW_SPEC_CYPHER, workflow_id=workflow_id).single()
             if not rec:
                 return None
-            return yaml.safe_load(rec["spec_yaml"])
+            return rec["version"], self._codec.decode(rec["spec"])
+
+    def get_workflow_spec(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the full spec for given workflow.
+        """
+        found = self.get_workflow(workflow_id)
+        return found[1] if found else None
+
+    def get_workflow_version(self, workflow_id: str) -> Optional[int]:
+        """
+        Retrieve only the current version of a workflow, without its spec.
+        """
+        with self._driver.session() as ses:
+            rec = ses.run(GET_WORKFLOW_VERSION_CYPHER, workflow_id=workflow_id).single()
+            return rec["version"] if rec else None
 
     def create_run_node(
         self, run_id: str, workflow_id: str, spec: Dict[str, Any], overrides: Dict[str, Any]
@@ -72,164 +532,139 @@ class GraphTracer:
         """
         Record a new Run node linked to its Workflow.
         """
-        spec_yaml = yaml.safe_dump(spec)
-        overrides_yaml = yaml.safe_dump(overrides)
         with self._driver.session() as ses:
             ses.run(
-                """
-                MATCH (w:Workflow {id: $workflow_id})
-                MERGE (r:Run {id: $run_id})
-                SET r.startedAt = datetime(), r.status = 'running',
-                    r.spec = $spec_yaml, r.overrides = $overrides_yaml
-                MERGE (w)-[:HAS_RUN]->(r)
-                """,
+                CREATE_RUN_CYPHER,
                 run_id=run_id,
                 workflow_id=workflow_id,
-                spec_yaml=spec_yaml,
-                overrides_yaml=overrides_yaml
+                spec=self._codec.encode(spec),
+                overrides=self._codec.encode(overrides)
             )
 
+    def fail_run(self, run_id: str, reason: str):
+        """
+        Mark a still-running Run as failed without any task results.
+        """
+        self.flush()
+        with self._driver.session() as ses:
+            ses.run(FAIL_RUN_CYPHER, run_id=run_id, reason=reason)
+
     def get_run_status(self, run_id: str) -> Optional[Dict[str, Any]]:
         """
         Fetch Run node and its Task statuses.
         """
+        self.flush()
         with self._driver.session() as ses:
-            rec = ses.run(
-                """
-                MATCH (r:Run {id: $run_id})
-                OPTIONAL MATCH (r)-[:EXECUTED]->(t:Task)
-                RETURN r.id AS runId, r.status AS status,
-                       r.startedAt AS startedAt, r.completedAt AS completedAt,
-                       collect({
-                         taskId: t.id,
-                         type: t.type,
-                         status: t.status,
-                         startedAt: t.startedAt,
-                         completedAt: t.completedAt
-                       }) AS tasks
-                """,
-                run_id=run_id
-            ).single()
+            rec = ses.run(RUN_STATUS_CYPHER, run_id=run_id).single()
             if not rec:
                 return None
-            return {
-                "runId": rec["runId"],
-                "status": rec["status"],
-                "startedAt": rec["startedAt"],
-                "completedAt": rec["completedAt"],
-                "tasks": rec["tasks"]
-            }
+            return run_status(rec)
 
     def create_task_node(self, run_id: str, task_id: str, task_payload: Dict[str, Any]):
         """
         Record a Task node for a given Run.
         """
-        payload_yaml = yaml.safe_dump(task_payload)
+        row = task_row(self._codec, run_id, task_id, task_payload)
+        if self._buffered:
+            self._enqueue("tasks", row)
+            return
         with self._driver.session() as ses:
-            ses.run(
-                """
-                MATCH (r:Run {id: $run_id})
-                MERGE (t:Task {id: $task_id})
-                SET t.type = $type, t.payload = $payload_yaml,
-                    t.status = 'pending'
-                MERGE (r)-[:EXECUTED]->(t)
-                """,
-                run_id=run_id,
-                task_id=task_id,
-                type=task_payload.get("type", ""),
-                payload_yaml=payload_yaml
-            )
+            ses.run(CREATE_TASKS_CYPHER, rows=[row])
+
+    def mark_tasks_running(self, run_id: str, task_ids: List[str]):
+        """
+        Move pending Tasks of a Run to 'running' as they are dispatched.
+        """
+        rows = [{"run_id": run_id, "task_id": task_id} for task_id in task_ids]
+        if self._buffered:
+            for row in rows:
+                self._enqueue("running", row)
+            return
+        with self._driver.session() as ses:
+            ses.run(MARK_RUNNING_CYPHER, rows=rows)
 
     def record_task_result(
         self, run_id: str, task_id: str, status: str, output: Any
-    ):
+    ) -> Optional[str]:
         """
         Update Task node status and output, mark Run completed if all done.
+        Returns the Run's final status if this result completed it. Buffered
+        writes return None; completion is logged when the batch is flushed.
         """
-        output_yaml = yaml.safe_dump(output)
+        row = result_row(self._codec, run_id, task_id, status, output)
+        if self._buffered:
+            self._enqueue("results", row)
+            return None
         with self._driver.session() as ses:
-            ses.run(
-                """
-                MATCH (t:Task {id: $task_id})<-[:EXECUTED]-(r:Run {id: $run_id})
-                SET t.status = $status,
-                    t.output = $output_yaml,
-                    t.completedAt = datetime()
-                """,
-                run_id=run_id,
-                task_id=task_id,
-                status=status,
-                output_yaml=output_yaml
-            )
-            # Check if all tasks done
-            res = ses.run(
-                """
-                MATCH (r:Run {id: $run_id})-[:EXECUTED]->(t:Task)
-                WITH r, collect(t.status) AS stats
-                WHERE NONE(s IN stats WHERE s = 'pending' OR s = 'running')
-                RETURN ALL(s IN stats WHERE s = 'pass') AS allPassed
-                """,
-                run_id=run_id
-            ).single()
-            if res:
-                all_passed = res["allPassed"]
-                new_status = "success" if all_passed else "failed"
-                ses.run(
-                    """
-                    MATCH (r:Run {id: $run_id})
-                    SET r.status = $new_status, r.completedAt = datetime()
-                    """,
-                    run_id=run_id,
-                    new_status=new_status
-                )
+            rec = ses.run(RECORD_RESULTS_CYPHER, rows=[row]).single()
+            return rec["status"] if rec else None
 
     def record_patch(self, run_id: str, task_id: str, updates: Dict[str, Any]):
         """
         Record that an AutoFix patch was applied to a Task.
         """
-        updates_yaml = yaml.safe_dump(updates)
+        row = patch_row(self._codec, run_id, task_id, updates)
+        if self._buffered:
+            self._enqueue("patches", row)
+            return
         with self._driver.session() as ses:
-            ses.run(
-                """
-                MATCH (t:Task {id: $task_id})<-[:EXECUTED]-(r:Run {id: $run_id})
-                MERGE (p:Patch {id: randomUUID()})
-                SET p.timestamp = datetime(), p.updates = $updates_yaml
-                MERGE (r)-[:HAS_PATCH]->(p)
-                MERGE (p)-[:PATCH_OF]->(t)
-                """,
-                run_id=run_id,
-                task_id=task_id,
-                updates_yaml=updates_yaml
-            )
+            ses.run(RECORD_PATCHES_CYPHER, rows=[row])
+
+    def get_run_tasks(self, run_id: str) -> List[Tuple[Dict[str, Any], str]]:
+        """
+        Fetch the (task spec, status) pairs recorded for a Run.
+        """
+        self.flush()
+        with self._driver.session() as ses:
+            return run_tasks(self._codec, ses.run(GET_RUN_TASKS_CYPHER, run_id=run_id))
 
     def apply_patch(self, run_id: str, task_id: str, updates: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
-        Modify in-memory DAG spec for the run and return corrected task(s).
+        Patch a task of the run and reset it and its transitive dependents to
+        pending, reopening the run if it had completed. Returns those tasks;
+        every other task keeps its recorded status and output.
         """
         # Load stored spec, apply patch, and re-persist. Simplest: rewrite node properties
+        self.flush()
         with self._driver.session() as ses:
-            rec = ses.run(
-                """
-                MATCH (r:Run {id: $run_id})
-                RETURN r.spec AS spec_yaml
-                """,
-                run_id=run_id
-            ).single()
-            spec = yaml.safe_load(rec["spec_yaml"])
-            # Find and update the specific task in spec
-            for task in spec.get("tasks", []):
-                if task["id"] == task_id:
-                    task.update(updates)
+            rec = ses.run(GET_RUN_SPEC_CYPHER, run_id=run_id).single()
+            spec, encoded = patch_spec(self._codec, rec["spec"], task_id, updates)
             # Save updated spec back
-            updated_yaml = yaml.safe_dump(spec)
-            ses.run(
-                """
-                MATCH (r:Run {id: $run_id})
-                SET r.spec = $updated_yaml
-                """,
-                run_id=run_id,
-                updated_yaml=updated_yaml
-            )
-            return spec.get("tasks", [])
+            ses.run(SET_RUN_SPEC_CYPHER, run_id=run_id, spec=encoded)
+            tasks = [task for task, _ in run_tasks(self._codec, ses.run(GET_RUN_TASKS_CYPHER, run_id=run_id))]
+            rows, retry = retry_rows(self._codec, run_id, tasks, task_id, updates)
+            if rows:
+                ses.run(RESET_TASKS_CYPHER, rows=rows)
+            return retry
+
+    def migrate_legacy_encoding(self, batch_size: int = 500) -> int:
+        """
+        Re-encode properties still stored as YAML strings with the configured
+        codec and backfill native properties, batch_size nodes per transaction.
+        Runs without task counters get them recounted from their tasks.
+        Safe to re-run. Returns the number of properties rewritten.
+        """
+        self.flush()
+        migrated = 0
+        with self._driver.session() as ses:
+            ses.run(BACKFILL_RUN_WORKFLOW_ID_CYPHER)
+            backfilled = 0
+            while True:
+                count = ses.run(BACKFILL_RUN_COUNTERS_CYPHER, limit=batch_size).single()["backfilled"]
+                if not count:
+                    break
+                backfilled += count
+                logger.info("Backfilled task counters of %d runs", backfilled)
+            for label, prop in ENCODED_PROPERTIES:
+                while True:
+                    recs = list(ses.run(legacy_select_cypher(label, prop), limit=batch_size))
+                    if not recs:
+                        break
+                    rows = [reencode_row(self._codec, label, prop, rec) for rec in recs]
+                    ses.run(reencode_cypher(label, prop), rows=rows)
+                    migrated += len(rows)
+                    logger.info("Re-encoded %d %s.%s properties", migrated, label, prop)
+        return migrated
 # at bottom of graph_tracer.py
     def __del__(self):
         self.close()
\ No newline at end of file
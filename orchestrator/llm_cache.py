@@ -0,0 +1,162 @@
+# orchestrator/llm_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class LLMResponseCache:
+    """
+    Content-addressed cache for LLM generations.
+
+    Keys are a SHA-256 over model ID, prompt and decoding parameters. Lookups
+    go to an in-memory LRU first and then, if `path` is set, to a SQLite file
+    that survives restarts and is shared by processes on the same volume.
+    Both tiers expire entries after `ttl` seconds and are capped in size
+    (least recently used entries are evicted). The SQLite tier is trimmed
+    every `evict_every` inserts rather than on each one, so it can exceed
+    `max_disk_entries` by that many rows per process in between. Safe to use
+    from the LLM executor threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 86400,
+        path: Optional[str] = None,
+        max_disk_entries: int = 10000,
+        evict_every: int = 100,
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_disk_entries = max_disk_entries
+        self._evict_every = max(1, evict_every)
+        self._puts_since_evict = 0
+        # key -> (expires_at, value)
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS llm_responses_last_access ON llm_responses (last_access)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """
+        Build a cache from LLM_CACHE (off | memory | sqlite), LLM_CACHE_PATH,
+        LLM_CACHE_TTL and LLM_CACHE_MAX_ENTRIES. Returns None when disabled.
+        """
+        mode = os.getenv("LLM_CACHE", "off").lower()
+        if mode not in ("memory", "sqlite"):
+            return None
+        return cls(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+            path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3") if mode == "sqlite" else None,
+        )
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, params: Dict[str, Any]) -> str:
+        blob = json.dumps([model_id, prompt, params], sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute(
+                        "UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key)
+                    )
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self._ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, value, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._puts_since_evict += 1
+                if self._puts_since_evict >= self._evict_every:
+                    self._puts_since_evict = 0
+                    self._evict_disk(now)
+                self._db.commit()
+
+    def _evict_disk(self, now: float):
+        # Expired rows first, then least recently used ones over the cap
+        self._db.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            """
+            DELETE FROM llm_responses WHERE key IN (
+                SELECT key FROM llm_responses ORDER BY last_access
+                LIMIT max(0, (SELECT count(*) FROM llm_responses) - ?)
+            )
+            """,
+            (self._max_disk_entries,),
+        )
+
+    def _remember(self, key: str, expires_at: float, value: str):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._memory),
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,11 +1,20 @@
 import os
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
 from dotenv import load_dotenv
 
 from ibm_watsonx_ai import APIClient, Credentials
 from ibm_watsonx_ai.foundation_models import ModelInference
 from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
 
+from orchestrator.llm_cache import LLMResponseCache
+from orchestrator.metrics import LLM_LATENCY
+
 # Load environment variables from .env file
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -27,10 +36,69 @@ if not project_id:
 credentials = Credentials(url=url, api_key=api_key)
 client = APIClient(credentials=credentials, project_id=project_id)
 
+# Reusable ModelInference handles, one per (model_id, parameter set)
+_models: Dict[str, ModelInference] = {}
+_models_lock = threading.Lock()
+
+# Process-wide executor for the async API. LLM_MAX_CONCURRENCY bounds how many
+# generations run at once; further calls queue until a worker frees up.
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_STREAM_DONE = object()
+
+# Response cache used by clients that are not given one explicitly (see
+# LLMResponseCache.from_env); None unless LLM_CACHE is set.
+default_cache: Optional[LLMResponseCache] = LLMResponseCache.from_env()
+
+
+def get_model(model_id: str, params: dict) -> ModelInference:
+    """
+    Return the shared ModelInference for this model and base parameter set,
+    creating it on first use. Per-call parameters are passed to each
+    generate call instead, so they do not grow the pool.
+    """
+    key = json.dumps([model_id, params], sort_keys=True, default=str)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = ModelInference(
+                    model_id=model_id,
+                    credentials=credentials,
+                    project_id=project_id,
+                    params=params,
+                )
+                _models[key] = model
+    return model
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DEFAULT_MAX_CONCURRENCY, thread_name_prefix="llm"
+                )
+    return _executor
+
+
 class LLMClient:
     """
     Wrapper around IBM watsonx.ai Granite foundation model inference.
     Provides text-generation, function-calling, and auto-fix capabilities.
+
+    Model handles are pooled per model ID and parameter set, so repeated
+    calls reuse one ModelInference. The `agenerate_text`/`astream_text`
+    coroutines run the blocking SDK calls on a bounded executor: the shared
+    process-wide one, or a private one when `max_concurrency` is given.
+
+    With a response cache, greedy generations (deterministic for a given
+    model, prompt and parameters) are answered from the cache. A cached
+    stream is replayed as a single chunk; streams closed early are not cached.
     """
 
     def __init__(
@@ -38,13 +106,20 @@ class LLMClient:
         model_id: str = "ibm/granite-13b-instruct-v2",
         decoding_method: str = "greedy",
         max_new_tokens: int = 200,
+        max_concurrency: Optional[int] = None,
+        cache: Optional[LLMResponseCache] = None,
     ):
         self.model_id = model_id
         self.client = client
+        self.cache = cache if cache is not None else default_cache
         self.params = {
             GenParams.DECODING_METHOD: decoding_method,
             GenParams.MAX_NEW_TOKENS: max_new_tokens,
         }
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+            if max_concurrency else _shared_executor()
+        )
 
     def generate_text(self, prompt: str, extra_params: dict = None) -> str:
         """
@@ -54,14 +129,22 @@ class LLMClient:
         if extra_params:
             params.update(extra_params)
 
-        model = ModelInference(
-            model_id=self.model_id,
-            credentials=credentials,
-            project_id=project_id,
-        )
+        key = None
+        if self.cache is not None and params.get(GenParams.DECODING_METHOD) == "greedy":
+            key = self.cache.make_key(self.model_id, prompt, params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        model = get_model(self.model_id, self.params)
+        started = time.monotonic()
         response = model.generate_text(prompt=prompt, params=params)
+        LLM_LATENCY.observe(time.monotonic() - started, self.model_id, "generate")
         # response typically includes {"generated_text": "..."}
-        return response.get("generated_text", str(response))
+        text = response.get("generated_text", str(response))
+        if key is not None:
+            self.cache.put(key, text)
+        return text
 
     def stream_text(self, prompt: str, extra_params: dict = None):
         """
@@ -73,13 +156,69 @@ class LLMClient:
         if extra_params:
             params.update(extra_params)
 
-        model = ModelInference(
-            model_id=self.model_id,
-            credentials=credentials,
-            project_id=project_id,
+        key = None
+        if self.cache is not None and params.get(GenParams.DECODING_METHOD) == "greedy":
+            key = self.cache.make_key(self.model_id, prompt, params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        model = get_model(self.model_id, self.params)
+        started = time.monotonic()
+        parts = []
+        try:
+            for chunk in model.generate_text(prompt=prompt, params=params):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            LLM_LATENCY.observe(time.monotonic() - started, self.model_id, "stream")
+        # Only reached when the stream ran to completion
+        if key is not None:
+            self.cache.put(key, "".join(parts))
+
+    async def agenerate_text(self, prompt: str, extra_params: dict = None) -> str:
+        """
+        Coroutine version of `generate_text`, run on the bounded executor so
+        the calling event loop stays responsive.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.generate_text, prompt, extra_params
         )
-        for chunk in model.generate_text(prompt=prompt, params=params):
-            yield chunk
+
+    async def astream_text(self, prompt: str, extra_params: dict = None) -> AsyncIterator[str]:
+        """
+        Async iterator over `stream_text` chunks. The blocking stream is
+        consumed on the bounded executor and handed to the event loop chunk
+        by chunk; closing the iterator early stops the worker.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for chunk in self.stream_text(prompt, extra_params):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_DONE)
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
 
     def call_function(
         self, name: str, arguments: dict, prompt: str = ""
@@ -93,15 +232,9 @@ class LLMClient:
             "arguments": arguments,
         }
         full_prompt = prompt or f"Call function `{name}` with arguments {arguments}."
-        model = ModelInference(
-            model_id=self.model_id,
-            credentials=credentials,
-            project_id=project_id,
-        )
-        response = model.generate_text(
-            prompt=full_prompt,
-            params={**self.params, GenParams.TOOL_FUNCTIONS: [func_payload]},
-        )
+        params = {**self.params, GenParams.TOOL_FUNCTIONS: [func_payload]}
+        model = get_model(self.model_id, self.params)
+        response = model.generate_text(prompt=full_prompt, params=params)
         return response.get("function_response", {})
 
 # Example usage (can be removed or moved to tests)
@@ -5,14 +5,24 @@ import logging
 import yaml
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from nats.aio.client import Client as NATS
 
 from orchestrator.bus import NATSPubSub
 from orchestrator.llm_client import LLMClient
-from orchestrator.graph_tracer import GraphTracer
+from orchestrator.llm_cache import LLMResponseCache
+from orchestrator.async_graph_tracer import AsyncGraphTracer
+from orchestrator.codec import StorageCodec, decode_message
 from orchestrator.config import load_config
+from orchestrator import metrics
+from orchestrator.run_state import RunStateStore
+from orchestrator.spec_cache import SpecCache
+from orchestrator.ws_hub import EventHub
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -29,18 +39,26 @@ app = FastAPI(title="Granite Copilot Orchestrator")
 nats = NATS()
 bus: NATSPubSub
 
-# Set up GraphTracer with Neo4j credentials
-tracer = GraphTracer(
-    uri=os.getenv("NEO4J_URI", CONFIG["neo4j_uri"]),
-    user=os.getenv("NEO4J_USER", CONFIG["neo4j_user"]),
-    pwd=os.getenv("NEO4J_PASSWORD", CONFIG["neo4j_password"])
-)
+# Async GraphTracer (created on startup so the driver binds to the server's event loop)
+tracer: AsyncGraphTracer
+
+# Parsed workflow specs and the workflow listing, kept in-process
+spec_cache = SpecCache(**CONFIG.get("spec_cache", {}))
+
+# Run statuses served by /api/runs/{run_id}, kept current by the bus
+RUN_STATE_CONFIG = CONFIG.get("run_state", {})
+run_state = RunStateStore(max_finished=RUN_STATE_CONFIG.get("max_finished", 1000))
+
+# Websocket clients share one workflow.events.> subscription through the hub
+hub = EventHub(**CONFIG.get("websocket", {}))
 
 # Initialize LLM client
 llm = LLMClient(
     model_id=CONFIG["llm"]["model_id"],
     decoding_method="greedy",
-    max_new_tokens=CONFIG["llm"]["timeout_secs"]
+    max_new_tokens=CONFIG["llm"]["timeout_secs"],
+    max_concurrency=CONFIG["llm"].get("max_concurrency"),
+    cache=LLMResponseCache(**CONFIG["llm"]["cache"]) if CONFIG["llm"].get("cache") else None
 )
 
 
@@ -54,22 +72,43 @@ class RunRequest(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    global bus
+    global bus, tracer
+    # Set up AsyncGraphTracer with Neo4j credentials and pool settings
+    tracer = AsyncGraphTracer(
+        uri=os.getenv("NEO4J_URI", CONFIG["neo4j_uri"]),
+        user=os.getenv("NEO4J_USER", CONFIG["neo4j_user"]),
+        pwd=os.getenv("NEO4J_PASSWORD", CONFIG["neo4j_password"]),
+        codec=StorageCodec(**CONFIG.get("storage", {})),
+        **CONFIG.get("graph_tracer", {})
+    )
+
     # Connect to NATS
     await nats.connect(servers=[CONFIG["nats_url"]])
-    bus = NATSPubSub(nats, tracer)
-
-    # Subscribe to planner and autofix responses
+    bus = NATSPubSub(
+        nats,
+        tracer,
+        CONFIG.get("scheduler"),
+        pipelined=CONFIG.get("bus", {}).get("pipelined", False),
+        compliance_config=CONFIG.get("compliance"),
+        run_state=run_state,
+        autofix_timeout=CONFIG.get("verify_timeouts", {}).get("autofix"),
+        state_ttl=CONFIG.get("bus", {}).get("state_ttl", 3600)
+    )
+
+    # Subscribe to planner, task result and autofix responses
     await bus.subscribe("workflow.plan.response", handle_plan_response)
+    await bus.subscribe("task.*.response", handle_task_response)
     await bus.subscribe("workflow.autofix.response", handle_autofix_response)
+    await bus.subscribe("workflow.events.>", handle_workflow_event)
 
     logger.info("Orchestrator connected to NATS and subscriptions set up")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    # Gracefully close NATS connection
+    # Gracefully close NATS connection, then flush and close the tracer
     await nats.drain()
+    await tracer.close()
 
 
 @app.post("/api/workflows", status_code=201)
@@ -79,7 +118,8 @@ async def create_workflow(workflow: WorkflowYAML):
         workflow_id = spec.get("name")
         if not workflow_id:
             raise ValueError("Missing 'name' field in workflow spec")
-        tracer.create_workflow_node(workflow_id, spec)
+        version = await tracer.create_workflow_node(workflow_id, spec)
+        spec_cache.put(workflow_id, version, spec)
         # Persist spec to object store or filesystem as needed
         return {"workflowId": workflow_id, "message": "Workflow created"}
     except Exception as e:
@@ -87,14 +127,41 @@ async def create_workflow(workflow: WorkflowYAML):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def load_workflow_spec(workflow_id: str):
+    """
+    Return a workflow spec from the cache, revalidating stale entries by
+    version and falling back to Neo4j on a miss.
+    """
+    cached = spec_cache.get(workflow_id)
+    if cached:
+        version, spec, stale = cached
+        if not stale:
+            return spec
+        if await tracer.get_workflow_version(workflow_id) == version:
+            spec_cache.touch(workflow_id)
+            return spec
+        spec_cache.invalidate(workflow_id)
+
+    found = await tracer.get_workflow(workflow_id)
+    if not found:
+        return None
+    version, spec = found
+    spec_cache.put(workflow_id, version, spec)
+    return spec
+
+
 @app.get("/api/workflows")
 async def list_workflows():
-    return tracer.list_workflows()
+    listing = spec_cache.listing()
+    if listing is None:
+        spec_cache.load_listing(await tracer.list_workflows())
+        listing = spec_cache.listing()
+    return listing
 
 
 @app.get("/api/workflows/{workflow_id}")
 async def get_workflow(workflow_id: str):
-    spec = tracer.get_workflow_spec(workflow_id)
+    spec = await load_workflow_spec(workflow_id)
     if not spec:
         raise HTTPException(status_code=404, detail="Workflow not found")
     return spec
@@ -102,44 +169,100 @@ async def get_workflow(workflow_id: str):
 
 @app.post("/api/workflows/{workflow_id}/runs", status_code=202)
 async def run_workflow(workflow_id: str, req: RunRequest):
-    spec = tracer.get_workflow_spec(workflow_id)
+    spec = await load_workflow_spec(workflow_id)
     if not spec:
         raise HTTPException(status_code=404, detail="Workflow not found")
     run_id = await bus.start_run(workflow_id, spec, req.overrides)
     return {"runId": run_id, "status": "scheduled"}
 
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
 @app.get("/api/runs/{run_id}")
-async def get_run_status(run_id: str):
-    status = tracer.get_run_status(run_id)
-    if not status:
-        raise HTTPException(status_code=404, detail="Run not found")
-    return status
+async def get_run_status(run_id: str, request: Request, waitForChange: float = 0):
+    """
+    Run status from the in-memory projection, with an ETag. A request whose
+    If-None-Match still matches gets 304; with ?waitForChange=<seconds> it is
+    held until the run changes (or the wait expires) instead.
+    """
+    current = run_state.snapshot(run_id)
+    if current is None:
+        # Not driven by this orchestrator: read through to Neo4j
+        status = await tracer.get_run_status(run_id)
+        if not status:
+            raise HTTPException(status_code=404, detail="Run not found")
+        run_state.seed(status)
+        current = run_state.snapshot(run_id)
+        if current is None:
+            return status
+
+    etag, status = current
+    if_none_match = request.headers.get("if-none-match")
+    if waitForChange > 0 and etag_matches(if_none_match, etag):
+        timeout = min(waitForChange, RUN_STATE_CONFIG.get("max_wait", 60))
+        if await run_state.wait_for_change(run_id, etag, timeout):
+            etag, status = run_state.snapshot(run_id) or current
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(jsonable_encoder(status), headers={"ETag": etag})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.websocket("/api/ws")
-async def websocket_endpoint(ws: WebSocket):
+async def websocket_endpoint(
+    ws: WebSocket,
+    runId: Optional[str] = None,
+    subject: Optional[str] = None,
+    batchMs: Optional[int] = None
+):
+    # Optional comma-separated run ids / subject patterns and a batching window
     await ws.accept()
-    # Subscribe to all workflow events
-    sub = await nats.subscribe("workflow.events.>", queue="ws_group")
-    try:
-        async for msg in sub.messages:
-            await ws.send_text(msg.data.decode())
-    except WebSocketDisconnect:
-        await sub.unsubscribe()
+    await hub.serve(
+        ws,
+        run_ids=runId.split(",") if runId else None,
+        subjects=subject.split(",") if subject else None,
+        batch_interval=batchMs / 1000 if batchMs is not None else None
+    )
 
 
 # Internal message handlers
 
 async def handle_plan_response(msg):
-    data = yaml.safe_load(msg.data.decode())
+    data = decode_message(msg.data)
     dag = data.get("dag")
     run_id = data.get("runId")
-    await bus.dispatch_tasks(run_id, dag)
+    bus.plan_received(run_id)
+    # Policy violations fail or hold the run before any task is dispatched
+    if await bus.preflight(run_id, dag):
+        await bus.dispatch_tasks(run_id, dag)
+
+
+async def handle_workflow_event(msg):
+    hub.publish(msg.subject, msg.data)
+
+
+async def handle_task_response(msg):
+    data = decode_message(msg.data)
+    await bus.handle_task_result(
+        data.get("runId"),
+        data.get("taskId"),
+        data.get("status"),
+        data.get("output", {})
+    )
 
 
 async def handle_autofix_response(msg):
-    data = yaml.safe_load(msg.data.decode())
+    data = decode_message(msg.data)
     run_id = data.get("runId")
     patch = data.get("patch")
     await bus.apply_patch_and_retry(run_id, patch)
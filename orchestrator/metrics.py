@@ -0,0 +1,131 @@
+# orchestrator/metrics.py
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+# Upper bounds (seconds) shared by the latency histograms below: 5 ms to 30 min
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0,
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram with optional labels, rendered in the
+    Prometheus text exposition format.
+
+    Each label combination owns a preallocated list of bucket counts, so
+    `observe` only does a bisect and two additions under a lock; it is safe
+    to call from the LLM executor threads. Counts are cumulative since
+    process start, as Prometheus expects (use rate() for rolling windows).
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                if len(labels) != len(self.labelnames):
+                    raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(pairs + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+PLAN_LATENCY = Histogram(
+    "granite_plan_latency_seconds",
+    "Time from publishing a plan request to receiving the planned DAG."
+)
+TASK_QUEUE_WAIT = Histogram(
+    "granite_task_queue_wait_seconds",
+    "Time a task spent ready but held back by its type's in-flight cap.",
+    ("type",)
+)
+TASK_EXECUTION = Histogram(
+    "granite_task_execution_seconds",
+    "Time from dispatching a task to receiving its result.",
+    ("type", "status")
+)
+TRACER_WRITE = Histogram(
+    "granite_tracer_write_seconds",
+    "Latency of GraphTracer Neo4j calls: buffered batch flushes and single statements.",
+    ("op",)
+)
+LLM_LATENCY = Histogram(
+    "granite_llm_call_seconds",
+    "Latency of LLM generation calls that reached the model, made by this process.",
+    ("model", "mode")
+)
+
+REGISTRY = [PLAN_LATENCY, TASK_QUEUE_WAIT, TASK_EXECUTION, TRACER_WRITE, LLM_LATENCY]
+
+
+def render() -> str:
+    """
+    All registered metrics in Prometheus text format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, addr: str = "") -> ThreadingHTTPServer:
+    """
+    Serve `GET /metrics` from a daemon thread, for processes without an
+    HTTP API of their own (e.g. the agents that call the LLM, whose
+    LLM_LATENCY is only recorded in their process).
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,30 @@
+# orchestrator/migrate_storage.py
+#
+# One-off migration of a provenance graph written with the old YAML encoding.
+# Usage: python -m orchestrator.migrate_storage [batch_size]
+
+import os
+import sys
+import logging
+from pathlib import Path
+
+from orchestrator.codec import StorageCodec
+from orchestrator.config import load_config
+from orchestrator.graph_tracer import GraphTracer
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == "__main__":
+    config = load_config(Path(__file__).parent / "config.yaml")
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    tracer = GraphTracer(
+        uri=os.getenv("NEO4J_URI", config["neo4j_uri"]),
+        user=os.getenv("NEO4J_USER", config["neo4j_user"]),
+        pwd=os.getenv("NEO4J_PASSWORD", config["neo4j_password"]),
+        codec=StorageCodec(**config.get("storage", {}))
+    )
+    try:
+        count = tracer.migrate_legacy_encoding(batch_size=batch_size)
+        print(f"Re-encoded {count} properties")
+    finally:
+        tracer.close()
@@ -0,0 +1,232 @@
+# orchestrator/run_state.py
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _counter(status: str) -> str:
+    # Same bucketing as RUN_COUNTERS in graph_tracer
+    if status in ("pending", "running"):
+        return status
+    return "passed" if status == "pass" else "failed"
+
+
+class RunState:
+    """
+    In-memory copy of one run's status document, as returned by
+    `GET /api/runs/{run_id}`.
+    """
+
+    def __init__(self, run_id: str, status: str = "running", started_at: Any = None):
+        self.run_id = run_id
+        self.status = status
+        self.started_at = started_at
+        self.completed_at = None
+        self.counts = {"pending": 0, "running": 0, "passed": 0, "failed": 0}
+        # task_id -> {taskId, type, status, startedAt, completedAt}
+        self.tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.version = 0
+        self.changed = asyncio.Event()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "runId": self.run_id,
+            "status": self.status,
+            "startedAt": self.started_at,
+            "completedAt": self.completed_at,
+            "counts": dict(self.counts),
+            "tasks": [dict(task) for task in self.tasks.values()]
+        }
+
+
+class RunStateStore:
+    """
+    Projection of run and task statuses, updated by the bus alongside each
+    GraphTracer write so the run-status API never has to query Neo4j for
+    runs this orchestrator is driving.
+
+    Transitions mirror the Cypher in graph_tracer: the same counters, and a
+    run completes (success/failed) once nothing is pending or running. Every
+    change bumps the run's version, which is exposed as an ETag, and wakes
+    long-polling readers. Runs still in progress are kept until the bus
+    `forget`s them after a period without activity; finished runs are
+    LRU-bounded by `max_finished`. Runs that are not held here (for
+    example after a restart) are read from Neo4j; once finished they are
+    adopted with `seed` so later reads are served from memory.
+    """
+
+    def __init__(self, max_finished: int = 1000):
+        self._max_finished = max_finished
+        self._runs: Dict[str, RunState] = {}
+        # Finished run ids, least recently used first
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        # Distinguishes ETags across restarts, since versions restart at 0
+        self._epoch = uuid.uuid4().hex[:8]
+
+    def get(self, run_id: str) -> Optional[RunState]:
+        run = self._runs.get(run_id)
+        if run is not None and run_id in self._finished:
+            self._finished.move_to_end(run_id)
+        return run
+
+    def etag(self, run: RunState) -> str:
+        return f'"{self._epoch}-{run.version}"'
+
+    def snapshot(self, run_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Return (etag, status document) for a run, or None if it is not held.
+        """
+        run = self.get(run_id)
+        if run is None:
+            return None
+        return self.etag(run), run.snapshot()
+
+    async def wait_for_change(self, run_id: str, etag: str, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds for a run whose current ETag is `etag`
+        to change. Returns True if it changed.
+        """
+        run = self._runs.get(run_id)
+        if run is None:
+            return False
+        if self.etag(run) != etag:
+            return True
+        # wait_for cancels the inner wait on timeout; shielding it would leak
+        # one pending task per expired long-poll on runs that never change
+        try:
+            await asyncio.wait_for(run.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def seed(self, status: Dict[str, Any]):
+        """
+        Adopt a status document read from Neo4j for a run not held here.
+        Runs still in progress are not adopted: this orchestrator did not
+        see their earlier transitions and may not see the later ones.
+        """
+        run_id = status["runId"]
+        if run_id in self._runs or status.get("status") == "running":
+            return
+        run = RunState(run_id, status.get("status"), status.get("startedAt"))
+        run.completed_at = status.get("completedAt")
+        run.counts.update({k: v or 0 for k, v in (status.get("counts") or {}).items()})
+        for task in status.get("tasks") or []:
+            if task.get("taskId") is not None:
+                run.tasks[task["taskId"]] = dict(task)
+        self._runs[run_id] = run
+        self._mark_finished(run_id)
+
+    def create_run(self, run_id: str):
+        self._runs[run_id] = RunState(run_id, started_at=_now())
+        self._finished.pop(run_id, None)
+
+    def create_tasks(self, run_id: str, tasks: Iterable[Dict[str, Any]]):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        for task in tasks:
+            previous = run.tasks.get(task["id"])
+            if previous is not None:
+                run.counts[_counter(previous["status"])] -= 1
+            run.tasks[task["id"]] = {
+                "taskId": task["id"],
+                "type": task.get("type"),
+                "status": "pending",
+                "startedAt": previous["startedAt"] if previous else None,
+                "completedAt": previous["completedAt"] if previous else None
+            }
+            run.counts["pending"] += 1
+        self._changed(run)
+
+    def mark_running(self, run_id: str, task_ids: List[str]):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        now = _now()
+        for task_id in task_ids:
+            task = run.tasks.get(task_id)
+            if task is None or task["status"] != "pending":
+                continue
+            self._move(run, task, "running")
+            task["startedAt"] = now
+        self._changed(run)
+
+    def record_result(self, run_id: str, task_id: str, status: str):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        task = run.tasks.get(task_id)
+        if task is None:
+            return
+        self._move(run, task, status)
+        task["completedAt"] = _now()
+        if run.status == "running" and run.counts["pending"] == 0 and run.counts["running"] == 0:
+            run.status = "success" if run.counts["failed"] == 0 else "failed"
+            run.completed_at = _now()
+            self._mark_finished(run_id)
+        self._changed(run)
+
+    def fail_run(self, run_id: str):
+        """
+        Fail a run that cannot proceed, whatever its task counters say.
+        """
+        run = self._runs.get(run_id)
+        if run is None or run.status != "running":
+            return
+        run.status = "failed"
+        run.completed_at = _now()
+        self._mark_finished(run_id)
+        self._changed(run)
+
+    def forget(self, run_id: str):
+        """
+        Drop a run still in progress that the bus has given up tracking, so
+        it is read from Neo4j again. Finished runs stay until LRU-evicted.
+        """
+        if run_id not in self._finished:
+            self._runs.pop(run_id, None)
+
+    def reset_tasks(self, run_id: str, task_ids: Iterable[str]):
+        """
+        Send tasks back to pending for a retry, reopening the run.
+        """
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        for task_id in task_ids:
+            task = run.tasks.get(task_id)
+            if task is None:
+                continue
+            self._move(run, task, "pending")
+            task["startedAt"] = task["completedAt"] = None
+        run.status = "running"
+        run.completed_at = None
+        self._finished.pop(run_id, None)
+        self._changed(run)
+
+    @staticmethod
+    def _move(run: RunState, task: Dict[str, Any], status: str):
+        run.counts[_counter(task["status"])] -= 1
+        run.counts[_counter(status)] += 1
+        task["status"] = status
+
+    @staticmethod
+    def _changed(run: RunState):
+        run.version += 1
+        run.changed.set()
+        run.changed = asyncio.Event()
+
+    def _mark_finished(self, run_id: str):
+        self._finished[run_id] = None
+        self._finished.move_to_end(run_id)
+        while len(self._finished) > self._max_finished:
+            evicted, _ = self._finished.popitem(last=False)
+            self._runs.pop(evicted, None)
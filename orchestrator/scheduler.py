@@ -0,0 +1,239 @@
+# orchestrator/scheduler.py
+
+import heapq
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class DagError(ValueError):
+    """
+    Raised when a DAG references unknown tasks, repeats a task id or contains a cycle.
+    """
+
+
+def _needs(task: Dict[str, Any]) -> List[str]:
+    needs = task.get("needs") or []
+    if isinstance(needs, str):
+        return [needs]
+    return list(needs)
+
+
+def validate_dag(tasks: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    Check that every `needs:` edge points at a known task and that the graph
+    is acyclic. Returns the task ids in topological order (Kahn's algorithm,
+    ties broken by declaration order).
+    """
+    tasks = list(tasks)
+    index: Dict[str, int] = {}
+    for pos, task in enumerate(tasks):
+        task_id = task.get("id")
+        if not task_id:
+            raise DagError(f"Task at position {pos} has no 'id'")
+        if task_id in index:
+            raise DagError(f"Duplicate task id '{task_id}'")
+        index[task_id] = pos
+
+    indegree = {task["id"]: 0 for task in tasks}
+    dependents: Dict[str, List[str]] = {task["id"]: [] for task in tasks}
+    for task in tasks:
+        for dep in _needs(task):
+            if dep not in index:
+                raise DagError(f"Task '{task['id']}' needs unknown task '{dep}'")
+            indegree[task["id"]] += 1
+            dependents[dep].append(task["id"])
+
+    heap = [(index[t], t) for t, deg in indegree.items() if deg == 0]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        _, task_id = heapq.heappop(heap)
+        order.append(task_id)
+        for child in dependents[task_id]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                heapq.heappush(heap, (index[child], child))
+
+    if len(order) != len(tasks):
+        cyclic = sorted(t for t, deg in indegree.items() if deg > 0)
+        raise DagError(f"DAG contains a cycle through: {', '.join(cyclic)}")
+    return order
+
+
+def downstream(tasks: Iterable[Dict[str, Any]], task_ids: Iterable[str]) -> List[str]:
+    """
+    Ids of `task_ids` plus every task that transitively needs one of them,
+    in declaration order.
+    """
+    tasks = list(tasks)
+    dependents: Dict[str, List[str]] = {}
+    for task in tasks:
+        for dep in _needs(task):
+            dependents.setdefault(dep, []).append(task["id"])
+
+    affected = set()
+    stack = list(task_ids)
+    while stack:
+        task_id = stack.pop()
+        if task_id in affected:
+            continue
+        affected.add(task_id)
+        stack.extend(dependents.get(task_id, ()))
+    return [task["id"] for task in tasks if task["id"] in affected]
+
+
+class DagScheduler:
+    """
+    In-memory scheduler for the tasks of a single run.
+
+    A task becomes ready once every task it `needs` has passed. Ready tasks
+    are kept in one heap per task type, ordered by the length of the longest
+    dependency chain hanging off them (critical path first) and then by
+    topological position, so independent work fans out as wide as the
+    per-type in-flight caps allow while long chains are started early.
+
+    `statuses` resumes a run from recorded task statuses (e.g. after an
+    orchestrator restart): passed tasks count as done, running tasks as in
+    flight, and any other finished status as failed.
+    """
+
+    PENDING = "pending"
+    READY = "ready"
+    RUNNING = "running"
+    PASSED = "pass"
+    FAILED = "fail"
+
+    def __init__(
+        self,
+        tasks: Iterable[Dict[str, Any]],
+        max_in_flight: Optional[Dict[str, int]] = None,
+        default_max_in_flight: int = 0,
+        statuses: Optional[Dict[str, str]] = None,
+    ):
+        tasks = list(tasks)
+        order = validate_dag(tasks)
+
+        self.tasks: Dict[str, Dict[str, Any]] = {t["id"]: t for t in tasks}
+        self.state: Dict[str, str] = {t: self.PENDING for t in self.tasks}
+        self._max_in_flight = max_in_flight or {}
+        self._default_max_in_flight = default_max_in_flight
+
+        self._needs: Dict[str, List[str]] = {t: _needs(self.tasks[t]) for t in self.tasks}
+        self._dependents: Dict[str, List[str]] = {t: [] for t in self.tasks}
+        for task_id, needs in self._needs.items():
+            for dep in needs:
+                self._dependents[dep].append(task_id)
+
+        # Longest chain of dependents below each task, computed in reverse topological order.
+        depth: Dict[str, int] = {}
+        for task_id in reversed(order):
+            depth[task_id] = 1 + max((depth[c] for c in self._dependents[task_id]), default=0)
+        self._priority = {t: (-depth[t], pos) for pos, t in enumerate(order)}
+
+        self._ready: Dict[str, List] = {}
+        self._in_flight: Dict[str, int] = {}
+        # When each queued task became ready (time.monotonic), for queue-wait metrics
+        self.ready_at: Dict[str, float] = {}
+        for task_id, status in (statuses or {}).items():
+            if task_id not in self.tasks or status == self.PENDING:
+                continue
+            if status == self.RUNNING:
+                self.state[task_id] = self.RUNNING
+                self._in_flight[self._type(task_id)] = self._in_flight.get(self._type(task_id), 0) + 1
+            else:
+                self.state[task_id] = self.PASSED if status == self.PASSED else self.FAILED
+
+        self._unmet: Dict[str, int] = {
+            t: sum(1 for dep in n if self.state[dep] != self.PASSED) for t, n in self._needs.items()
+        }
+        for task_id in order:
+            if self.state[task_id] == self.PENDING and self._unmet[task_id] == 0:
+                self._push_ready(task_id)
+
+    def _type(self, task_id: str) -> str:
+        return self.tasks[task_id].get("type", "")
+
+    def _cap(self, task_type: str) -> int:
+        return self._max_in_flight.get(task_type, self._default_max_in_flight)
+
+    def _push_ready(self, task_id: str):
+        self.state[task_id] = self.READY
+        self.ready_at[task_id] = time.monotonic()
+        heap = self._ready.setdefault(self._type(task_id), [])
+        heapq.heappush(heap, (self._priority[task_id], task_id))
+
+    def release(self) -> List[Dict[str, Any]]:
+        """
+        Pop every ready task that fits under its type's in-flight cap, mark it
+        running and return the task specs in priority order.
+        """
+        released = []
+        for task_type, heap in self._ready.items():
+            cap = self._cap(task_type)
+            in_flight = self._in_flight.get(task_type, 0)
+            while heap and (cap <= 0 or in_flight < cap):
+                prio, task_id = heapq.heappop(heap)
+                self.state[task_id] = self.RUNNING
+                in_flight += 1
+                released.append((prio, task_id))
+            self._in_flight[task_type] = in_flight
+        released.sort()
+        return [self.tasks[task_id] for _, task_id in released]
+
+    def complete(self, task_id: str, status: str) -> bool:
+        """
+        Record the result of a running task. Dependents of a passed task whose
+        predecessors have now all passed move to the ready queue; dependents
+        of a failed task stay pending. Returns False for unknown or duplicate results.
+        """
+        if self.state.get(task_id) != self.RUNNING:
+            return False
+        task_type = self._type(task_id)
+        self._in_flight[task_type] = max(0, self._in_flight.get(task_type, 0) - 1)
+
+        if status != self.PASSED:
+            self.state[task_id] = self.FAILED
+            return True
+
+        self.state[task_id] = self.PASSED
+        for child in self._dependents[task_id]:
+            self._unmet[child] -= 1
+            if self._unmet[child] == 0 and self.state[child] == self.PENDING:
+                self._push_ready(child)
+        return True
+
+    def reset(self, tasks: Iterable[Dict[str, Any]]):
+        """
+        Return tasks to pending for a retry, replacing their specs with the
+        given (patched) ones. The set must be closed under dependents, as
+        `downstream` returns it; tasks outside it keep their state, so passed
+        predecessors are not re-run. Ready or running tasks are left alone.
+        """
+        reset_ids = []
+        for task in tasks:
+            task_id = task["id"]
+            if task_id not in self.tasks or self.state[task_id] in (self.READY, self.RUNNING):
+                continue
+            self.tasks[task_id] = task
+            self.state[task_id] = self.PENDING
+            reset_ids.append(task_id)
+        for task_id in reset_ids:
+            self._unmet[task_id] = sum(1 for dep in self._needs[task_id] if self.state[dep] != self.PASSED)
+        for task_id in sorted(reset_ids, key=self._priority.__getitem__):
+            if self._unmet[task_id] == 0:
+                self._push_ready(task_id)
+
+    def blocked(self) -> List[str]:
+        """
+        Ids of tasks still pending, i.e. waiting on a predecessor that failed
+        (directly or transitively) once the scheduler has finished.
+        """
+        return [t for t, s in self.state.items() if s == self.PENDING]
+
+    @property
+    def finished(self) -> bool:
+        """
+        True when nothing is running or ready, i.e. every task either passed,
+        failed, or is blocked behind a failure.
+        """
+        return not any(s in (self.READY, self.RUNNING) for s in self.state.values())
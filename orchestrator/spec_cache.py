@@ -0,0 +1,83 @@
+# orchestrator/spec_cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SpecCache:
+    """
+    Versioned, LRU-bounded cache of parsed workflow specs, plus a listing
+    index of id/name/schedule so `GET /api/workflows` never touches YAML.
+
+    Entries are filled when a workflow is created or first read, and replaced
+    whenever a newer version is written. Because other orchestrator replicas
+    can update a workflow too, an entry older than `revalidate_after` seconds
+    is reported as stale; the caller then compares its version with the cheap
+    `get_workflow_version` lookup and either refreshes the entry or refetches
+    the spec. Cached specs are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = 256, revalidate_after: float = 30.0):
+        self._max_entries = max_entries
+        self._revalidate_after = revalidate_after
+        # workflow_id -> (version, spec, checked_at)
+        self._specs: "OrderedDict[str, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        self._listing: Optional[Dict[str, Dict[str, str]]] = None
+        self._listing_loaded_at = 0.0
+
+    def get(self, workflow_id: str) -> Optional[Tuple[int, Dict[str, Any], bool]]:
+        """
+        Return (version, spec, stale) for a cached workflow, or None on a miss.
+        """
+        entry = self._specs.get(workflow_id)
+        if entry is None:
+            return None
+        self._specs.move_to_end(workflow_id)
+        version, spec, checked_at = entry
+        stale = time.monotonic() - checked_at > self._revalidate_after
+        return version, spec, stale
+
+    def put(self, workflow_id: str, version: int, spec: Dict[str, Any]):
+        """
+        Cache a spec unless a newer version is already cached.
+        """
+        entry = self._specs.get(workflow_id)
+        if entry is not None and entry[0] > version:
+            return
+        self._specs[workflow_id] = (version, spec, time.monotonic())
+        self._specs.move_to_end(workflow_id)
+        while len(self._specs) > self._max_entries:
+            self._specs.popitem(last=False)
+        if self._listing is not None:
+            self._listing[workflow_id] = {
+                "workflowId": workflow_id,
+                "name": workflow_id,
+                "schedule": spec.get("schedule", "")
+            }
+
+    def touch(self, workflow_id: str):
+        """
+        Mark a cached entry as just revalidated against the store.
+        """
+        entry = self._specs.get(workflow_id)
+        if entry is not None:
+            self._specs[workflow_id] = (entry[0], entry[1], time.monotonic())
+
+    def invalidate(self, workflow_id: str):
+        self._specs.pop(workflow_id, None)
+
+    def listing(self) -> Optional[List[Dict[str, str]]]:
+        """
+        Return the listing index, or None if it was never loaded or is due
+        for a reload from the store.
+        """
+        if self._listing is None:
+            return None
+        if time.monotonic() - self._listing_loaded_at > self._revalidate_after:
+            return None
+        return list(self._listing.values())
+
+    def load_listing(self, entries: List[Dict[str, str]]):
+        self._listing = {entry["workflowId"]: entry for entry in entries}
+        self._listing_loaded_at = time.monotonic()
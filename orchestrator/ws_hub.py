@@ -0,0 +1,167 @@
+# orchestrator/ws_hub.py
+
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger("orchestrator.ws_hub")
+
+
+def subject_matches(pattern: str, subject: str) -> bool:
+    """
+    NATS-style subject match: `*` matches one token, a trailing `>` the rest.
+    """
+    pattern_tokens = pattern.split(".")
+    subject_tokens = subject.split(".")
+    for i, token in enumerate(pattern_tokens):
+        if token == ">":
+            return len(subject_tokens) > i
+        if i >= len(subject_tokens) or (token != "*" and token != subject_tokens[i]):
+            return False
+    return len(pattern_tokens) == len(subject_tokens)
+
+
+class HubClient:
+    """
+    One websocket connection of the hub: its filters and bounded send queue.
+    Events are `workflow.events.<runId>...` subjects; `run_ids` and
+    `subjects` (NATS-style patterns) narrow what the client receives.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        max_queue: int,
+        run_ids: Optional[Iterable[str]] = None,
+        subjects: Optional[Iterable[str]] = None,
+        batch_interval: float = 0.0,
+    ):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_interval = batch_interval
+        self.evicted = False
+        self.sender: Optional[asyncio.Task] = None
+        self.set_filters(run_ids, subjects)
+
+    def set_filters(self, run_ids=None, subjects=None):
+        self.run_ids = set(run_ids) if run_ids else None
+        self.subjects = list(subjects) if subjects else None
+
+    def wants(self, subject: str, run_id: str) -> bool:
+        if self.run_ids is not None and run_id not in self.run_ids:
+            return False
+        if self.subjects is not None and not any(subject_matches(p, subject) for p in self.subjects):
+            return False
+        return True
+
+
+class EventHub:
+    """
+    Fans workflow events from a single NATS subscription out to websocket
+    clients.
+
+    Each client has a bounded send queue drained by its own sender task.
+    A client whose queue overflows is a slow consumer: it is evicted (its
+    socket closed with 1013 "try again later") instead of buffering without
+    limit or slowing down the others. With a batch interval, a client gets
+    the events collected over that interval as one JSON array frame of at
+    most `max_batch` events.
+    """
+
+    def __init__(self, max_queue: int = 256, max_batch: int = 100, batch_interval: float = 0.0):
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.batch_interval = batch_interval
+        self.clients = set()
+        self.evictions = 0
+
+    def publish(self, subject: str, data: bytes):
+        """
+        Queue an event for every client whose filters match. Never blocks.
+        """
+        if not self.clients:
+            return
+        tokens = subject.split(".", 3)
+        run_id = tokens[2] if len(tokens) > 2 else ""
+        text = data.decode()
+        for client in list(self.clients):
+            if client.evicted or not client.wants(subject, run_id):
+                continue
+            try:
+                client.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self._evict(client)
+
+    def _evict(self, client: HubClient):
+        client.evicted = True
+        self.clients.discard(client)
+        self.evictions += 1
+        logger.warning("Evicting slow websocket client (%d queued events)", client.queue.qsize())
+        # The sender may be stuck in a send to this client; stop it outright
+        if client.sender:
+            client.sender.cancel()
+        asyncio.create_task(self._close(client.ws, 1013))
+
+    @staticmethod
+    async def _close(ws: WebSocket, code: int):
+        try:
+            await ws.close(code=code)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def serve(self, ws: WebSocket, run_ids=None, subjects=None, batch_interval: Optional[float] = None):
+        """
+        Serve one accepted websocket until it disconnects or is evicted.
+        Clients may send `{"runIds": [...], "subjects": [...]}` to change
+        their filters.
+        """
+        client = HubClient(
+            ws,
+            self.max_queue,
+            run_ids,
+            subjects,
+            self.batch_interval if batch_interval is None else batch_interval
+        )
+        self.clients.add(client)
+        sender = client.sender = asyncio.create_task(self._send_loop(client))
+        try:
+            while not sender.done():
+                receive = asyncio.create_task(ws.receive_json())
+                done, _ = await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if receive not in done:
+                    receive.cancel()
+                    break
+                message = receive.result()
+                if isinstance(message, dict):
+                    client.set_filters(message.get("runIds"), message.get("subjects"))
+        except (WebSocketDisconnect, RuntimeError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    async def _send_loop(self, client: HubClient):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                text = await client.queue.get()
+                if client.batch_interval <= 0:
+                    await client.ws.send_text(text)
+                    continue
+
+                batch = [text]
+                deadline = loop.time() + client.batch_interval
+                while len(batch) < self.max_batch:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        text = await asyncio.wait_for(client.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(text)
+                await client.ws.send_text("[" + ",".join(batch) + "]")
+        except (WebSocketDisconnect, RuntimeError):
+            pass
@@ -0,0 +1,88 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("nats")
+
+AGENT_PATH = Path(__file__).resolve().parents[1] / "agents" / "build_agent" / "agent.py"
+spec = importlib.util.spec_from_file_location("build_agent", AGENT_PATH)
+build_agent = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(build_agent)
+
+
+def _context(tmp_path, dockerignore, files):
+    (tmp_path / "Dockerfile").write_text("FROM scratch\n")
+    (tmp_path / ".dockerignore").write_text(dockerignore)
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return str(tmp_path)
+
+
+def _digest(context):
+    return build_agent.build_digest(context, None, {})
+
+
+def _changes_digest(tmp_path, context, name):
+    before = _digest(context)
+    (tmp_path / name).write_text("changed")
+    return _digest(context) != before
+
+
+def _ignored(dockerignore, path, tmp_path):
+    (tmp_path / ".dockerignore").write_text(dockerignore)
+    patterns = build_agent._dockerignore_patterns(str(tmp_path))
+    return build_agent._ignored(path, patterns)
+
+
+def test_allowlist_dockerignore_hashes_reincluded_files(tmp_path):
+    context = _context(tmp_path, "*\n!src\n", {"src/app/main.py": "v1", "README.md": "v1"})
+    assert _changes_digest(tmp_path, context, "src/app/main.py")
+    assert not _changes_digest(tmp_path, context, "README.md")
+
+
+def test_last_matching_pattern_wins(tmp_path):
+    context = _context(
+        tmp_path,
+        "docs\n!docs/keep.md\ndocs/keep.md\n!docs/keep.md\n",
+        {"docs/keep.md": "v1", "docs/drop.md": "v1"}
+    )
+    assert _changes_digest(tmp_path, context, "docs/keep.md")
+    assert not _changes_digest(tmp_path, context, "docs/drop.md")
+
+
+def test_single_star_does_not_cross_directories(tmp_path):
+    context = _context(tmp_path, "*.log\n", {"build.log": "v1", "sub/build.log": "v1"})
+    assert not _changes_digest(tmp_path, context, "build.log")
+    assert _changes_digest(tmp_path, context, "sub/build.log")
+
+
+@pytest.mark.parametrize("pattern, path, ignored", [
+    ("**/*.log", "a/b/c.log", True),
+    ("**/*.log", "c.log", True),
+    ("a/**/c", "a/c", True),
+    ("a/**/c", "a/x/y/c", True),
+    ("a/*/c", "a/x/y/c", False),
+    ("/node_modules", "node_modules/pkg/index.js", True),
+    ("build", "src/build", False),
+    ("*/build", "src/build/out.o", True),
+    ("file?.txt", "file1.txt", True),
+    ("file?.txt", "dir/file1.txt", False),
+    ("[^a]*.py", "b.py", True),
+    ("[^a]*.py", "a.py", False),
+])
+def test_pattern_matching(tmp_path, pattern, path, ignored):
+    assert _ignored(pattern + "\n", path, tmp_path) is ignored
+
+
+def test_dockerfile_and_dockerignore_are_always_sent(tmp_path):
+    context = _context(tmp_path, "*\n", {})
+    assert _changes_digest(tmp_path, context, "Dockerfile")
+    assert _changes_digest(tmp_path, context, ".dockerignore")
+
+
+def test_unsupported_pattern_hashes_whole_context(tmp_path):
+    context = _context(tmp_path, "[unclosed\nREADME.md\n", {"README.md": "v1"})
+    assert _changes_digest(tmp_path, context, "README.md")
@@ -0,0 +1,117 @@
+import json
+import re
+import shutil
+import subprocess
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from orchestrator.compliance import COMPLIANCE_RULES, PolicyEngine
+
+POLICY_PATH = Path(__file__).resolve().parents[1] / "policies" / "compliance" / "policy.rego"
+
+# (input, expected deny, expected warn); run through both the Python port
+# and, when the opa binary is available, the Rego source.
+CASES = [
+    (
+        {"task": {"type": "helm-upgrade", "payload": {"namespace": "staging", "image_tag": "1.2.3"}}},
+        [],
+        [],
+    ),
+    (
+        {"task": {"type": "helm-upgrade", "payload": {"namespace": "prod", "image_tag": "v1.2.3"}}},
+        ["Helm upgrade must deploy to 'staging', not 'prod'."],
+        [],
+    ),
+    (
+        {"task": {"type": "helm-upgrade", "payload": {"namespace": "staging", "image_tag": "latest"}}},
+        ["Image tag 'latest' is not a valid semver (e.g. '1.2.3')."],
+        [],
+    ),
+    (
+        {"task": {"type": "helm-upgrade", "payload": {"namespace": "staging", "image_tag": "1.2.3-rc1"}}},
+        ["Image tag '1.2.3-rc1' is not a valid semver (e.g. '1.2.3')."],
+        [],
+    ),
+    (
+        {"task": {"type": "helm-upgrade", "payload": {"namespace": "staging", "image_tag": "1.2.3\n"}}},
+        ["Image tag '1.2.3\n' is not a valid semver (e.g. '1.2.3')."],
+        [],
+    ),
+    (
+        {"task": {"type": "helm-upgrade", "payload": {}}},
+        [],
+        [],
+    ),
+    (
+        {"task": {"type": "docker-build", "payload": {"context": "./services/api"}}, "run": {"concurrency": 5}},
+        [],
+        [],
+    ),
+    (
+        {"task": {"type": "docker-build", "payload": {"context": "./tmp"}}, "run": {"concurrency": 8}},
+        ["Docker build context './tmp' must be under './services/'."],
+        ["High build concurrency (8) may overwhelm registry."],
+    ),
+    (
+        {"task": {"type": "llm-doc", "payload": {"template": "notes.md"}}},
+        [],
+        [],
+    ),
+    (
+        {"task": {"type": "llm-doc", "payload": {"template": False}}},
+        ["llm-doc task missing 'template' parameter."],
+        [],
+    ),
+    (
+        {"task": {"type": "llm-doc", "payload": {}}},
+        ["llm-doc task missing 'template' parameter."],
+        [],
+    ),
+    (
+        {"task": {"type": "pytest", "payload": {"namespace": "prod", "context": "./tmp"}}},
+        [],
+        [],
+    ),
+]
+
+
+def _rego_rules():
+    """
+    (decision, task type) of every rule in the Rego source.
+    """
+    source = POLICY_PATH.read_text()
+    rules = []
+    for decision, body in re.findall(r"^(deny|warn)\[msg\]\s*\{(.*?)^\}", source, re.M | re.S):
+        task_type = re.search(r'input\.task\.type\s*==\s*"([^"]+)"', body)
+        rules.append((decision, task_type.group(1) if task_type else None))
+    return rules
+
+
+def test_python_port_has_a_rule_for_every_rego_rule():
+    rules = _rego_rules()
+    assert rules
+    assert Counter(rules) == Counter((decision, task_type) for decision, task_type, _ in COMPLIANCE_RULES)
+
+
+@pytest.mark.parametrize("doc, deny, warn", CASES)
+def test_python_port_decisions(doc, deny, warn):
+    decision = PolicyEngine().evaluate(doc)
+    assert sorted(decision["deny"]) == sorted(deny)
+    assert sorted(decision["warn"]) == sorted(warn)
+
+
+@pytest.mark.skipif(shutil.which("opa") is None, reason="opa binary not installed")
+@pytest.mark.parametrize("doc, deny, warn", CASES)
+def test_rego_decisions(doc, deny, warn):
+    result = subprocess.run(
+        ["opa", "eval", "--format", "json", "--stdin-input", "--data", str(POLICY_PATH), "data.compliance"],
+        input=json.dumps(doc),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    decision = json.loads(result.stdout)["result"][0]["expressions"][0]["value"]
+    assert sorted(decision.get("deny", [])) == sorted(deny)
+    assert sorted(decision.get("warn", [])) == sorted(warn)
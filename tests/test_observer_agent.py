@@ -0,0 +1,116 @@
+import asyncio
+import importlib.util
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("nats")
+web = pytest.importorskip("aiohttp.web")
+import aiohttp  # noqa: E402
+
+AGENT_PATH = Path(__file__).resolve().parents[1] / "agents" / "observer_agent" / "agent.py"
+spec = importlib.util.spec_from_file_location("observer_agent", AGENT_PATH)
+observer_agent = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(observer_agent)
+
+
+async def _webhook(status=200):
+    """
+    Local webhook endpoint recording (arrival time, JSON body) per post.
+    """
+    received = []
+
+    async def handler(request):
+        received.append((time.monotonic(), await request.json()))
+        return web.Response(status=status)
+
+    app = web.Application()
+    app.router.add_post("/hook", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/hook", received
+
+
+async def _drain(agent, entries, posts, timeout=5):
+    aggregator = asyncio.create_task(agent.aggregate())
+    try:
+        for entry in entries:
+            await agent.handle(entry)
+        deadline = time.monotonic() + timeout
+        while agent.counters["posted"] + agent.counters["failed"] < posts:
+            assert time.monotonic() < deadline, agent.counters
+            await asyncio.sleep(0.01)
+    finally:
+        aggregator.cancel()
+
+
+def _entry(run_id, task_id, message, level="ERROR"):
+    return {"timestamp": "t", "level": level, "message": message, "runId": run_id, "taskId": task_id}
+
+
+def test_entries_are_batched_per_task_and_rate_limited(monkeypatch):
+    monkeypatch.setattr(observer_agent, "NOTIFY_WINDOW", 0.05)
+
+    async def scenario():
+        runner, url, received = await _webhook()
+        monkeypatch.setenv("SLACK_WEBHOOK_URL", url)
+        agent = observer_agent.ObserverAgent(None)
+        agent.bucket = observer_agent.TokenBucket(rate=10, burst=1)
+        async with aiohttp.ClientSession() as agent.session:
+            await _drain(agent, [
+                _entry("r1", "build", "disk full"),
+                _entry("r1", "build", "disk full"),
+                _entry("r1", "build", "push failed", level="WARN"),
+                _entry("r2", "test", "flaky test", level="WARN"),
+                _entry("r3", None, "planner timed out"),
+                {"timestamp": "t", "level": "INFO", "message": "ignored", "runId": "r1"},
+            ], posts=3)
+        await runner.cleanup()
+        return agent, received
+
+    agent, received = asyncio.run(scenario())
+    texts = [body["text"] for _, body in received]
+    assert len(texts) == 3
+    assert texts[0].startswith("*ERROR* 3 entries in run `r1` task `build`")
+    assert "disk full (x2)\npush failed" in texts[0]
+    assert texts[1] == "*WARN* at t in run `r2` task `test`: flaky test"
+    assert texts[2] == "*ERROR* at t in run `r3`: planner timed out"
+    # One token of burst, then one post per 100 ms
+    gaps = [later[0] - earlier[0] for earlier, later in zip(received, received[1:])]
+    assert all(gap >= 0.08 for gap in gaps), gaps
+    assert agent.counters == {"queued": 5, "dropped": 0, "posted": 3, "failed": 0}
+
+
+def test_failed_posts_and_full_queue_are_counted(monkeypatch):
+    monkeypatch.setattr(observer_agent, "NOTIFY_WINDOW", 0.05)
+    monkeypatch.setattr(observer_agent, "NOTIFY_QUEUE_SIZE", 2)
+
+    async def scenario():
+        runner, url, received = await _webhook(status=500)
+        monkeypatch.setenv("SLACK_WEBHOOK_URL", url)
+        agent = observer_agent.ObserverAgent(None)
+        for i in range(3):
+            await agent.handle(_entry("r1", "build", f"error {i}"))
+        async with aiohttp.ClientSession() as agent.session:
+            await _drain(agent, [], posts=1)
+        await runner.cleanup()
+        return agent, received
+
+    agent, received = asyncio.run(scenario())
+    assert len(received) == 1
+    assert agent.counters == {"queued": 2, "dropped": 1, "posted": 0, "failed": 1}
+
+
+def test_zero_rate_disables_the_limit():
+    async def scenario():
+        bucket = observer_agent.TokenBucket(rate=0, burst=0)
+        started = time.monotonic()
+        for _ in range(100):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
@@ -0,0 +1,66 @@
+import asyncio
+
+from orchestrator.run_state import RunStateStore
+
+
+def _finished_run(store: RunStateStore, run_id: str = "r1"):
+    store.create_run(run_id)
+    store.create_tasks(run_id, [{"id": "build", "type": "docker-build"}])
+    store.mark_running(run_id, ["build"])
+    store.record_result(run_id, "build", "pass")
+
+
+def test_wait_for_change_times_out_without_leaking_tasks():
+    async def scenario():
+        store = RunStateStore()
+        _finished_run(store)
+        etag, _ = store.snapshot("r1")
+        before = len(asyncio.all_tasks())
+        for _ in range(50):
+            assert await store.wait_for_change("r1", etag, 0.001) is False
+        await asyncio.sleep(0)
+        return before, len(asyncio.all_tasks())
+
+    before, after = asyncio.run(scenario())
+    assert after == before
+
+
+def test_wait_for_change_wakes_on_update():
+    async def scenario():
+        store = RunStateStore()
+        _finished_run(store)
+        etag, _ = store.snapshot("r1")
+        waiter = asyncio.create_task(store.wait_for_change("r1", etag, 5))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        store.reset_tasks("r1", ["build"])
+        return await waiter, store.snapshot("r1")
+
+    changed, (etag, doc) = asyncio.run(scenario())
+    assert changed is True
+    assert doc["status"] == "running"
+    assert doc["counts"]["pending"] == 1
+
+
+def test_run_completes_from_counters():
+    store = RunStateStore()
+    store.create_run("r1")
+    store.create_tasks("r1", [{"id": "a", "type": "pytest"}, {"id": "b", "type": "snyk"}])
+    store.mark_running("r1", ["a", "b"])
+    store.record_result("r1", "a", "pass")
+    assert store.snapshot("r1")[1]["status"] == "running"
+    store.record_result("r1", "b", "fail")
+    _, doc = store.snapshot("r1")
+    assert doc["status"] == "failed"
+    assert doc["counts"] == {"pending": 0, "running": 0, "passed": 1, "failed": 1}
+
+
+def test_forget_drops_only_unfinished_runs():
+    store = RunStateStore()
+    _finished_run(store, "done")
+    store.create_run("stuck")
+    store.create_tasks("stuck", [{"id": "build", "type": "docker-build"}])
+    store.forget("stuck")
+    store.forget("done")
+    assert store.snapshot("stuck") is None
+    assert store.snapshot("done")[1]["status"] == "success"
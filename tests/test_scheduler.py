@@ -0,0 +1,150 @@
+import pytest
+
+from orchestrator.scheduler import DagError, DagScheduler, downstream, validate_dag
+
+
+def _task(task_id, needs=(), task_type="pytest"):
+    return {"id": task_id, "type": task_type, "needs": list(needs)}
+
+
+def _ids(tasks):
+    return [task["id"] for task in tasks]
+
+
+def test_validate_dag_returns_topological_order_by_declaration():
+    tasks = [_task("c", ["a"]), _task("a"), _task("b"), _task("d", ["c", "b"])]
+    assert validate_dag(tasks) == ["a", "c", "b", "d"]
+
+
+def test_validate_dag_accepts_single_string_needs():
+    assert validate_dag([{"id": "a"}, {"id": "b", "needs": "a"}]) == ["a", "b"]
+
+
+@pytest.mark.parametrize("tasks, message", [
+    ([_task("a", ["b"]), _task("b", ["a"])], "cycle through: a, b"),
+    ([_task("a", ["a"])], "cycle through: a"),
+    ([_task("a", ["missing"])], "unknown task 'missing'"),
+    ([_task("a"), _task("a")], "Duplicate task id 'a'"),
+    ([{"type": "pytest"}], "has no 'id'"),
+])
+def test_validate_dag_rejects_invalid_graphs(tasks, message):
+    with pytest.raises(DagError, match=message):
+        validate_dag(tasks)
+
+
+def test_scheduler_rejects_invalid_graphs():
+    with pytest.raises(DagError):
+        DagScheduler([_task("a", ["b"]), _task("b", ["a"])])
+
+
+def test_release_follows_dependencies_and_critical_path():
+    scheduler = DagScheduler([
+        _task("lint"),
+        _task("build", task_type="docker-build"),
+        _task("test", ["build"]),
+        _task("deploy", ["test"], task_type="deploy"),
+    ])
+    # build heads the longest chain, so it goes first despite its position
+    assert _ids(scheduler.release()) == ["build", "lint"]
+    assert scheduler.release() == []
+    assert scheduler.complete("build", "pass")
+    assert _ids(scheduler.release()) == ["test"]
+    assert scheduler.complete("test", "pass")
+    assert scheduler.complete("lint", "pass")
+    assert _ids(scheduler.release()) == ["deploy"]
+    assert scheduler.complete("deploy", "pass")
+    assert scheduler.finished
+
+
+def test_release_waits_for_every_predecessor():
+    scheduler = DagScheduler([_task("a"), _task("b"), _task("c", ["a", "b"])])
+    scheduler.release()
+    scheduler.complete("a", "pass")
+    assert scheduler.release() == []
+    scheduler.complete("b", "pass")
+    assert _ids(scheduler.release()) == ["c"]
+
+
+def test_complete_ignores_unknown_and_duplicate_results():
+    scheduler = DagScheduler([_task("a")])
+    assert not scheduler.complete("a", "pass")
+    scheduler.release()
+    assert scheduler.complete("a", "pass")
+    assert not scheduler.complete("a", "pass")
+    assert not scheduler.complete("missing", "pass")
+
+
+def test_per_type_caps_limit_tasks_in_flight():
+    scheduler = DagScheduler(
+        [_task(f"t{i}") for i in range(4)] + [_task("scan", task_type="snyk")],
+        max_in_flight={"pytest": 2},
+        default_max_in_flight=0,
+    )
+    assert _ids(scheduler.release()) == ["t0", "t1", "scan"]
+    assert scheduler.release() == []
+    scheduler.complete("t0", "fail")
+    assert _ids(scheduler.release()) == ["t2"]
+    scheduler.complete("t1", "pass")
+    scheduler.complete("t2", "pass")
+    assert _ids(scheduler.release()) == ["t3"]
+
+
+def test_default_cap_applies_to_unlisted_types():
+    scheduler = DagScheduler([_task("a"), _task("b"), _task("c")], default_max_in_flight=1)
+    assert _ids(scheduler.release()) == ["a"]
+    scheduler.complete("a", "pass")
+    assert _ids(scheduler.release()) == ["b"]
+
+
+def test_failure_blocks_transitive_dependents():
+    scheduler = DagScheduler([
+        _task("build"),
+        _task("test", ["build"]),
+        _task("deploy", ["test"]),
+        _task("lint"),
+    ])
+    scheduler.release()
+    scheduler.complete("build", "fail")
+    assert not scheduler.finished
+    scheduler.complete("lint", "pass")
+    assert scheduler.release() == []
+    assert scheduler.finished
+    assert scheduler.blocked() == ["test", "deploy"]
+
+
+def test_downstream_returns_transitive_dependents_in_declaration_order():
+    tasks = [_task("a"), _task("b", ["a"]), _task("c"), _task("d", ["b", "c"]), _task("e", ["c"])]
+    assert downstream(tasks, ["a"]) == ["a", "b", "d"]
+    assert downstream(tasks, ["c"]) == ["c", "d", "e"]
+    assert downstream(tasks, ["d"]) == ["d"]
+
+
+def test_reset_reruns_patched_task_and_dependents_only():
+    tasks = [_task("build"), _task("test", ["build"]), _task("deploy", ["test"])]
+    scheduler = DagScheduler(tasks)
+    scheduler.release()
+    scheduler.complete("build", "pass")
+    scheduler.release()
+    scheduler.complete("test", "fail")
+    assert scheduler.finished
+
+    patched = dict(tasks[1], payload={"path": "tests/unit"})
+    scheduler.reset([patched, tasks[2]])
+    assert _ids(scheduler.release()) == ["test"]
+    assert scheduler.tasks["test"]["payload"] == {"path": "tests/unit"}
+    scheduler.complete("test", "pass")
+    assert _ids(scheduler.release()) == ["deploy"]
+    assert scheduler.state["build"] == DagScheduler.PASSED
+
+
+def test_resume_from_recorded_statuses():
+    tasks = [_task("build"), _task("test", ["build"]), _task("lint"), _task("deploy", ["test", "lint"])]
+    scheduler = DagScheduler(
+        tasks,
+        max_in_flight={"pytest": 1},
+        statuses={"build": "pass", "lint": "running", "test": "pending"},
+    )
+    # lint still holds the only pytest slot
+    assert scheduler.release() == []
+    scheduler.complete("lint", "pass")
+    assert _ids(scheduler.release()) == ["test"]
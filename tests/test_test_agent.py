@@ -0,0 +1,57 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("nats")
+
+AGENT_PATH = Path(__file__).resolve().parents[1] / "agents" / "test_agent" / "agent.py"
+spec = importlib.util.spec_from_file_location("test_agent", AGENT_PATH)
+test_agent = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(test_agent)
+
+
+@pytest.fixture
+def suite(tmp_path, monkeypatch):
+    monkeypatch.setattr(test_agent, "DURATIONS_PATH", str(tmp_path / "state" / "durations.json"))
+    root = tmp_path / "repo"
+    for name in ("test_a.py", "test_b.py", "test_c.py", "test_slow.py"):
+        path = root / "tests" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("def test_ok():\n    pass\n")
+    monkeypatch.chdir(root)
+    return root
+
+
+def _report(root, durations):
+    return {
+        "root": str(root),
+        "tests": [
+            {"nodeid": f"tests/{name}::test_ok", "call": {"duration": spent}}
+            for name, spent in durations.items()
+        ],
+    }
+
+
+def test_duration_sharding_uses_recorded_durations_for_default_path(suite):
+    test_agent.save_durations([
+        _report(suite, {"test_a.py": 1.0, "test_b.py": 1.0, "test_c.py": 1.0, "test_slow.py": 30.0})
+    ])
+    shards = test_agent.split_shards(test_agent.discover_test_files("./"), 2, "duration")
+    assert sorted(shards, key=len) == [
+        ["./tests/test_slow.py"],
+        ["./tests/test_a.py", "./tests/test_b.py", "./tests/test_c.py"],
+    ]
+
+
+def test_duration_keys_match_absolute_targets(suite):
+    test_agent.save_durations([_report(suite, {"test_slow.py": 30.0, "test_a.py": 1.0})])
+    targets = [str(suite / "tests" / "test_slow.py::test_ok"), str(suite / "tests" / "test_a.py")]
+    assert test_agent.split_shards(targets, 2, "duration") == [[targets[0]], [targets[1]]]
+
+
+def test_sharded_run_without_test_files_fails(tmp_path):
+    result = asyncio.run(test_agent.run_tests({"path": str(tmp_path), "shards": 2}))
+    assert result["status"] == "fail"
+    assert result["summary"]["total"] == 0